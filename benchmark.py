@@ -0,0 +1,365 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Sin ventana: el render se hace sobre un QImage con la plataforma offscreen
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from calibracion import CalibrationRun, grid_sweep  # noqa: E402
+from misiones import compile_mission  # noqa: E402
+from ocupacion import CoverageGrid  # noqa: E402
+from odometria import METODOS_INTEGRACION, integrate_ticks, step_pose  # noqa: E402
+from perfilado import peak_rss_mb  # noqa: E402
+from reproduccion import EncoderLog, stream_poses, write_log  # noqa: E402
+from sensor import EncoderModel, EncoderPair  # noqa: E402
+from servidor import PoseClient, PoseServer  # noqa: E402
+
+LONGITUDES_RASTRO = (10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+SUBMUESTREOS = (1, 10, 100)  # lecturas finas agrupadas en cada muestra de encoder
+TOLERANCIA = 0.10  # empeoramiento relativo a partir del cual se marca una regresión
+
+
+def _best_time(fn, repeats):
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _random_ticks(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(-10, 11, n), rng.integers(-10, 11, n)
+
+
+def bench_integrators(results, n_python, n_batch, repeats):
+    left, right = _random_ticks(n_python)
+    left, right = left.tolist(), right.tolist()
+
+    def python_loop():
+        x = y = theta = 0.0
+        for l, r in zip(left, right):
+            x, y, theta, _ = step_pose(x, y, theta, l, r)
+
+    results["integrador_python"] = {"valor": n_python / _best_time(python_loop, repeats),
+                                    "unidad": "pasos/s", "mayor_es_mejor": True}
+
+    left, right = _random_ticks(n_batch)
+    results["integrador_batch"] = {"valor": n_batch / _best_time(lambda: integrate_ticks(left, right), repeats),
+                                   "unidad": "pasos/s", "mayor_es_mejor": True}
+
+
+def bench_schemes(results, n_steps, repeats):
+    """Error de la pose final frente a coste por muestra de cada esquema de integración.
+
+    La referencia son tramos de velocidad de rueda constante integrados con
+    el arco exacto a resolución fina; cada esquema recibe las mismas lecturas
+    agrupadas de `factor` en `factor`, como un encoder muestreado más despacio.
+    """
+    rng = np.random.default_rng(1)
+    segment = max(SUBMUESTREOS) * 10
+    segments = n_steps // segment
+    left = np.repeat(rng.uniform(0, 2, segments), segment)
+    right = np.repeat(rng.uniform(0, 2, segments), segment)
+    x, y, _, _ = integrate_ticks(left, right, method="arc")
+    reference = np.array([x[-1], y[-1]])
+
+    for factor in SUBMUESTREOS:
+        coarse_left = left.reshape(-1, factor).sum(axis=1)
+        coarse_right = right.reshape(-1, factor).sum(axis=1)
+        for method in METODOS_INTEGRACION:
+            x, y, _, _ = integrate_ticks(coarse_left, coarse_right, method=method)
+            cost = _best_time(lambda: integrate_ticks(coarse_left, coarse_right, method=method), repeats)
+            label = f"esquema_{method}_x{factor}"
+            results[f"{label}_error"] = {"valor": float(np.hypot(*(np.array([x[-1], y[-1]]) - reference))),
+                                         "unidad": "cm", "mayor_es_mejor": False}
+            results[f"{label}_coste"] = {"valor": 1e9 * cost / len(coarse_left),
+                                         "unidad": "ns/muestra", "mayor_es_mejor": False}
+            results[f"{label}_total"] = {"valor": 1000 * cost, "unidad": "ms", "mayor_es_mejor": False}
+
+
+def bench_paint(results, lengths, repeats):
+    from PySide6 import QtGui, QtWidgets
+    from giodometria_final import SimulationWidget
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    rng = np.random.default_rng(0)
+    for n in lengths:
+        widget = SimulationWidget(trail_capacity=max(n, 2))
+        # Paseo aleatorio dentro del lienzo, con segmentos cortos como los reales
+        xs = np.clip(250 + np.cumsum(rng.standard_normal(n)) * 0.5, 1, 499)
+        ys = np.clip(250 + np.cumsum(rng.standard_normal(n)) * 0.5, 1, 499)
+        widget.trail.extend(xs, ys)
+        image = QtGui.QImage(widget.size(), QtGui.QImage.Format_ARGB32_Premultiplied)
+
+        def full():
+            # Sin cachés: el fondo y las capas del rastro se rehacen enteros
+            widget._background = None
+            widget._trail_layer.invalidate()
+            widget._true_trail_layer.invalidate()
+            widget.render(image)
+
+        def incremental():
+            widget.move_by_encoders(1, 1)
+            widget.render(image)
+
+        label = f"1e{round(math.log10(n))}"
+        results[f"paint_completo_{label}"] = {"valor": 1000 * _best_time(full, repeats),
+                                              "unidad": "ms", "mayor_es_mejor": False}
+        results[f"paint_incremental_{label}"] = {"valor": 1000 * _best_time(incremental, repeats),
+                                                 "unidad": "ms", "mayor_es_mejor": False}
+        widget.deleteLater()
+    app.processEvents()
+
+
+def bench_viewport(results, n, repeats):
+    """Coste de un frame al desplazar la vista sobre un rastro de n puntos, en varios niveles de zoom."""
+    from PySide6 import QtGui, QtWidgets
+    from giodometria_final import SimulationWidget
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    rng = np.random.default_rng(0)
+    widget = SimulationWidget(trail_capacity=n, world_size=None)
+    points = np.cumsum(rng.standard_normal((n, 2)), axis=0)
+    widget.trail.extend(points[:, 0], points[:, 1])
+    widget.fit_view()
+    image = QtGui.QImage(widget.size(), QtGui.QImage.Format_ARGB32_Premultiplied)
+
+    def pan():
+        widget.viewport.pan(7, 3)
+        widget.render(image)
+
+    label = f"1e{round(math.log10(n))}"
+    for zoom in (1, 16, 256):
+        results[f"vista_pan_{label}_x{zoom}"] = {"valor": 1000 * _best_time(pan, repeats),
+                                                 "unidad": "ms", "mayor_es_mejor": False}
+        widget.viewport.zoom(16)
+    widget.deleteLater()
+    app.processEvents()
+
+
+def bench_replay(results, n_records, repeats):
+    left, right = _random_ticks(n_records)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.odolog")
+        write_log(path, np.arange(n_records) * 1e-3, left, right)
+        log = EncoderLog(path)
+
+        def replay():
+            for _ in stream_poses(log):
+                pass
+
+        results["reproduccion"] = {"valor": n_records / _best_time(replay, repeats),
+                                   "unidad": "registros/s", "mayor_es_mejor": True}
+        del log
+
+
+def bench_replay_window(results, n_records, repeats):
+    """Reproducción a máxima velocidad por el camino real de la ventana: rastros diezmados, cobertura y pintado."""
+    from PySide6 import QtWidgets
+    from giodometria_final import MainWindow
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    left, right = _random_ticks(n_records)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.odolog")
+        write_log(path, np.arange(n_records) * 1e-3, left, right)
+        window = MainWindow(world_size=None, seed=0)
+        window.show()  # para que cada frame también se pinte
+        window.loop.stop()
+
+        def replay():
+            window.reproducir(path)
+            window.player.set_speed(None)
+            while window.player is not None and window.player.position < n_records:
+                app.processEvents()
+
+        results["reproduccion_ventana"] = {"valor": n_records / _best_time(replay, repeats),
+                                           "unidad": "registros/s", "mayor_es_mejor": True}
+        window.detener_reproduccion()
+        window.close()
+        window.deleteLater()
+        app.processEvents()
+
+
+def bench_sensor(results, n_samples, repeats):
+    model = EncoderModel(prob_perdido=1e-3, prob_duplicado=1e-3, jitter=1e-5)
+
+    def generate():
+        for _ in EncoderPair(model, model, seed=0).stream(30.0, 25.0, n_samples / 1000):
+            pass
+
+    results["sensor_encoders"] = {"valor": n_samples / _best_time(generate, repeats),
+                                  "unidad": "muestras/s", "mayor_es_mejor": True}
+
+
+def bench_mission(results, repeats):
+    source = "repeat 5000 { forward 2 m, arc r=50 90°, rotate -45° }"
+
+    def run_mission():
+        compile_mission(source).run()
+
+    steps = len(compile_mission(source))
+    results["mision"] = {"valor": steps / _best_time(run_mission, repeats), "unidad": "pasos/s", "mayor_es_mejor": True}
+
+
+def bench_coverage(results, n_python, n_batch, repeats):
+    # Pasos como los del simulador (hasta 0.1 cm) en un paseo aleatorio plegado al mundo de 5 x 5 m
+    rng = np.random.default_rng(0)
+    x, y, _, _ = integrate_ticks(rng.integers(0, 11, n_batch), rng.integers(0, 11, n_batch), 250.0, 250.0)
+    x, y = 500 - np.abs(np.mod(x, 1000) - 500), 500 - np.abs(np.mod(y, 1000) - 500)
+    grid = CoverageGrid(500, 500)
+    xs, ys = x[:n_python].tolist(), y[:n_python].tolist()
+
+    def per_step():
+        grid.start(xs[0], ys[0])
+        for px, py in zip(xs, ys):
+            grid.move_to(px, py)
+
+    def batch():
+        grid.start(x[0], y[0])
+        grid.extend(x, y)
+
+    results["cobertura_paso"] = {"valor": n_python / _best_time(per_step, repeats),
+                                 "unidad": "pasos/s", "mayor_es_mejor": True}
+    results["cobertura_batch"] = {"valor": n_batch / _best_time(batch, repeats),
+                                  "unidad": "pasos/s", "mayor_es_mejor": True}
+
+
+def bench_server(results, n_requests, repeats):
+    """Actualizaciones por segundo de una conexión al servidor de poses, esperando cada respuesta o en pipeline."""
+    import asyncio
+
+    async def measure():
+        server = PoseServer(world_size=None)
+        await server.start(port=0)
+        client = await PoseClient.connect(port=server._server.sockets[0].getsockname()[1])
+
+        async def round_trips():
+            for _ in range(n_requests):
+                await client.move(0, 10, 9)
+
+        async def pipelined():
+            await asyncio.gather(*(client.move(0, 10, 9) for _ in range(n_requests)))
+
+        times = {}
+        for name, fn in (("servidor_ida_vuelta", round_trips), ("servidor_pipeline", pipelined)):
+            best = math.inf
+            for _ in range(repeats):
+                start = time.perf_counter()
+                await fn()
+                best = min(best, time.perf_counter() - start)
+            times[name] = best
+        await client.close()
+        server.close()
+        return times
+
+    for name, best in asyncio.run(measure()).items():
+        results[name] = {"valor": n_requests / best, "unidad": "actualizaciones/s", "mayor_es_mejor": True}
+
+
+def bench_calibration(results, points, repeats):
+    # Cuadrados UMBmark en ambos sentidos con la pose real cada 50 pasos
+    runs = []
+    for turn in (1, -1):
+        left = np.array(([10] * 300 + [-5 * turn] * 40) * 4)
+        right = np.array(([10] * 300 + [5 * turn] * 40) * 4)
+        x, y, theta, _ = integrate_ticks(left, right, separacion=13.4)
+        steps = np.arange(50, len(left) + 1, 50)
+        runs.append(CalibrationRun(left, right, steps, np.column_stack((x, y, theta))[steps - 1]))
+    candidates = points ** 3
+    results["calibracion_barrido"] = {"valor": candidates / _best_time(lambda: grid_sweep(runs, points=points), repeats),
+                                      "unidad": "candidatos/s", "mayor_es_mejor": True}
+
+
+def run(quick=False):
+    scale = 10 if quick else 1
+    repeats = 3 if quick else 5
+    results = {}
+    bench_integrators(results, 200_000 // scale, 5_000_000 // scale, repeats)
+    bench_schemes(results, 2_000_000 // scale, repeats)
+    bench_paint(results, LONGITUDES_RASTRO[:4] if quick else LONGITUDES_RASTRO, repeats)
+    bench_viewport(results, 10_000_000 // scale, repeats)
+    bench_replay(results, 5_000_000 // scale, repeats)
+    bench_replay_window(results, 1_000_000 // scale, repeats)
+    bench_sensor(results, 5_000_000 // scale, repeats)
+    bench_mission(results, repeats)
+    bench_coverage(results, 200_000 // scale, 5_000_000 // scale, repeats)
+    bench_server(results, 20_000 // scale, repeats)
+    bench_calibration(results, 21 if quick else 47, repeats)
+    peak = peak_rss_mb()
+    if peak is not None:
+        results["rss_pico"] = {"valor": peak, "unidad": "MB", "mayor_es_mejor": False}
+    return {
+        "plataforma": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "rapido": quick,
+        "resultados": results,
+    }
+
+
+def compare(current, baseline, tolerance=TOLERANCIA):
+    """Lista de (nombre, base, actual, cambio relativo) que empeoran más de `tolerance`.
+
+    Con --rapido los tamaños son otros, así que dos informes de modos
+    distintos no se pueden comparar y se lanza ValueError.
+    """
+    if current.get("rapido") != baseline.get("rapido"):
+        modes = {True: "rápido", False: "completo", None: "desconocido"}
+        raise ValueError(f"La referencia es de un modo {modes[baseline.get('rapido')]} y la ejecución de un modo "
+                         f"{modes[current.get('rapido')]}; repite con el mismo modo")
+    regressions = []
+    for name, base in baseline["resultados"].items():
+        if name not in current["resultados"] or base["valor"] == 0:
+            continue
+        value = current["resultados"][name]["valor"]
+        change = (value - base["valor"]) / base["valor"]
+        worse = -change if base["mayor_es_mejor"] else change
+        if worse > tolerance:
+            regressions.append((name, base["valor"], value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del simulador de odometría")
+    parser.add_argument("--salida", help="fichero JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="JSON de referencia con el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                        help="empeoramiento relativo permitido antes de marcar regresión (por defecto 0.10)")
+    parser.add_argument("--rapido", action="store_true", help="tamaños reducidos para una pasada rápida")
+    args = parser.parse_args(argv)
+
+    report = run(args.rapido)
+    for name, result in report["resultados"].items():
+        print(f"{name:28s} {result['valor']:16.3f} {result['unidad']}")
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(report, baseline, args.tolerancia)
+        except ValueError as error:
+            print(f"ERROR: {error}")
+            return 2
+        for name, base, value, change in regressions:
+            print(f"REGRESION {name}: {base:.3f} -> {value:.3f} ({change:+.1%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+import struct
+
+import numpy as np
+from PySide6 import QtCore, QtGui, QtNetwork
+
+from puntos_control import PoseCheckpoints
+from reproduccion import BLOQUE, stream_poses
+from servidor import CABECERA, ESTADO, ROBOT_ESTADO, SUSCRIBIR, frame
+
+FRECUENCIA_FISICA = 1000  # Hz
+MAX_PASOS_POR_LLAMADA = 250  # pasos que se recuperan como mucho en cada llamada al timer
+PRESUPUESTO_FRAME = 0.010  # s de trabajo por frame al reproducir un log
+REGISTROS_MINIMOS = 1024  # registros por frame como mínimo, por lento que vaya
+
+
+class SimulationLoop(QtCore.QObject):
+    """Reloj de simulación con paso fijo, independiente del render.
+
+    La física avanza en pasos de 1 / physics_hz segundos: cada paso llama a
+    step_fn(left_ticks, right_ticks, simulate_error) con los ticks que giran
+    las ruedas a la velocidad actual durante ese intervalo. El número de pasos
+    depende solo del tiempo transcurrido, nunca de cuánto tarde el pintado,
+    así que la trayectoria es la misma a 30 o a 144 FPS. render_fn se llama
+    a la frecuencia de refresco de la pantalla y solo si el robot se movió o
+    se pidió con request_render(). Si fleet_fn no es None, se llama con dt en
+    cada paso para avanzar una flota de robots.
+    """
+
+    def __init__(self, step_fn, render_fn, physics_hz=FRECUENCIA_FISICA, render_hz=None, parent=None):
+        super().__init__(parent)
+        self.step_fn = step_fn
+        self.render_fn = render_fn
+        self.physics_hz = physics_hz
+        self.dt = 1.0 / physics_hz
+        if render_hz is None:
+            screen = QtGui.QGuiApplication.primaryScreen()
+            render_hz = screen.refreshRate() if screen is not None else 60
+        self.render_hz = render_hz or 60
+
+        self.left_speed = 0.0  # ticks por segundo
+        self.right_speed = 0.0
+        self.simulate_error = False
+        self.fleet_fn = None
+
+        self._clock = QtCore.QElapsedTimer()
+        self._physics_timer = QtCore.QTimer(self)
+        self._physics_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._physics_timer.setInterval(max(1, round(1000 / physics_hz)))
+        self._physics_timer.timeout.connect(self._on_physics_timer)
+        self._render_timer = QtCore.QTimer(self)
+        self._render_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._render_timer.setInterval(max(1, round(1000 / self.render_hz)))
+        self._render_timer.timeout.connect(self._on_render_timer)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.overruns = 0  # llamadas en las que hubo que descartar pasos atrasados
+        self.dropped_ticks = 0
+        self.frames = 0
+        self.jitter_max = 0.0  # segundos
+        self._jitter_sum = 0.0
+        self._jitter_count = 0
+        self._dirty = True
+        self._base_tick = 0
+        self._origin_ns = self._clock.nsecsElapsed() if self._clock.isValid() else 0
+        self._last_call_ns = None
+
+    def set_wheel_speeds(self, left_speed, right_speed, simulate_error=False):
+        self.left_speed = left_speed
+        self.right_speed = right_speed
+        self.simulate_error = simulate_error
+
+    def start(self):
+        self._clock.start()
+        self._origin_ns = 0
+        self._last_call_ns = None
+        self._base_tick = self.ticks
+        self._physics_timer.start()
+        self._render_timer.start()
+
+    def stop(self):
+        self._physics_timer.stop()
+        self._render_timer.stop()
+
+    def pause(self):
+        """Detiene la física pero sigue pintando lo que se pida con request_render()."""
+        self._physics_timer.stop()
+        self._render_timer.start()
+
+    def is_running(self):
+        return self._physics_timer.isActive()
+
+    def step(self):
+        """Avanza exactamente un paso de física."""
+        if self.left_speed or self.right_speed:
+            self.step_fn(self.left_speed * self.dt, self.right_speed * self.dt, self.simulate_error)
+            self._dirty = True
+        if self.fleet_fn is not None:
+            self.fleet_fn(self.dt)
+            self._dirty = True
+        self.ticks += 1
+
+    def request_render(self):
+        self._dirty = True
+
+    def _on_physics_timer(self):
+        now_ns = self._clock.nsecsElapsed()
+        if self._last_call_ns is not None:
+            interval = (now_ns - self._last_call_ns) * 1e-9
+            jitter = abs(interval - self._physics_timer.interval() / 1000)
+            self.jitter_max = max(self.jitter_max, jitter)
+            self._jitter_sum += jitter
+            self._jitter_count += 1
+        self._last_call_ns = now_ns
+
+        due = int((now_ns - self._origin_ns) * 1e-9 * self.physics_hz) - (self.ticks - self._base_tick)
+        if due > MAX_PASOS_POR_LLAMADA:
+            # Demasiado atraso: se descartan los pasos sobrantes en lugar de
+            # bloquear la interfaz intentando recuperarlos.
+            self.overruns += 1
+            self.dropped_ticks += due - MAX_PASOS_POR_LLAMADA
+            self._origin_ns += round((due - MAX_PASOS_POR_LLAMADA) * 1e9 / self.physics_hz)
+            due = MAX_PASOS_POR_LLAMADA
+        for _ in range(due):
+            self.step()
+
+    def _on_render_timer(self):
+        if self._dirty:
+            self._dirty = False
+            self.frames += 1
+            self.render_fn()
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "frames": self.frames,
+            "jitter_medio_ms": 1000 * self._jitter_sum / self._jitter_count if self._jitter_count else 0.0,
+            "jitter_max_ms": 1000 * self.jitter_max,
+            "overruns": self.overruns,
+            "pasos_descartados": self.dropped_ticks,
+        }
+
+
+class LogPlayer(QtCore.QObject):
+    """Reproduce un EncoderLog a velocidad ajustable.
+
+    En cada frame integra los registros cuyo timestamp ya ha llegado según
+    el reloj de reproducción (speed=1, 10...) o, con speed=None, un bloque
+    fijo tan rápido como se pueda pintar. on_poses(x, y, theta, distancia)
+    recibe los arrays de poses nuevas; on_seek(x, y, theta, distancia) la
+    pose desde la que se continúa tras un salto, que se reconstruye desde el
+    checkpoint más cercano. Los checkpoints se calculan por bloques en el
+    bucle de eventos, uno por vuelta, y los saltos solo llegan hasta donde
+    ya están calculados. Cada frame procesa como mucho los registros que,
+    al ritmo medido en el frame anterior, caben en PRESUPUESTO_FRAME, de
+    modo que la interfaz sigue respondiendo aunque on_poses sea lento.
+    """
+
+    finished = QtCore.Signal()
+
+    def __init__(self, log, on_poses, on_seek, pose=(0.0, 0.0, 0.0, 0.0), speed=1.0, method="euler", parent=None):
+        super().__init__(parent)
+        self.log = log
+        self.on_poses = on_poses
+        self.on_seek = on_seek
+        self.initial_pose = pose
+        self.pose = pose
+        self.position = 0  # registros ya integrados
+        self.method = method
+        self.checkpoints = PoseCheckpoints.from_log(log, pose=pose, method=method, lazy=True)
+        self.speed = speed
+        self._build_timer = QtCore.QTimer(self)
+        self._build_timer.setInterval(0)
+        self._build_timer.timeout.connect(self._build_checkpoints)
+        self._build_timer.start()
+        self._frame_records = REGISTROS_MINIMOS  # se ajusta en cada frame según lo que tarda
+        self._work = QtCore.QElapsedTimer()
+        self._clock = QtCore.QElapsedTimer()
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._on_timer)
+        self._set_interval()
+
+    def start(self):
+        self._restart_clock()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def is_running(self):
+        return self._timer.isActive()
+
+    def set_speed(self, speed):
+        self.speed = speed
+        self._set_interval()
+        self._restart_clock()
+
+    def _set_interval(self):
+        # A toda velocidad se sigue en cuanto el bucle de eventos ha pintado y atendido la entrada
+        self._timer.setInterval(0 if self.speed is None else 16)
+
+    def current_time(self):
+        if self.position == 0:
+            return self.log.start_time
+        return float(self.log.t[self.position - 1])
+
+    def _restart_clock(self):
+        self._clock.start()
+        self._time_origin = self.current_time()
+
+    def seek(self, time):
+        self.seek_index(self.log.index_at(time))
+
+    def _build_checkpoints(self):
+        if self.checkpoints.build(1):
+            self._build_timer.stop()
+
+    def seek_index(self, index):
+        index = min(index, self.checkpoints.available)
+        self.position = index
+        self.pose = self.checkpoints.pose_at(index)
+        self._restart_clock()
+        self.on_seek(*self.pose)
+
+    def _on_timer(self):
+        if self.speed is None:
+            stop = self.position + self._frame_records
+        else:
+            # Si no da tiempo a seguir al reloj, la reproducción se retrasa en lugar de congelar la interfaz
+            stop = min(self.log.index_at(self._time_origin + self._clock.elapsed() / 1000 * self.speed),
+                       self.position + self._frame_records)
+        start = self.position
+        self._work.start()
+        for x, y, theta, distancia in stream_poses(self.log, self.position, stop, self.pose, method=self.method):
+            self.pose = (x[-1], y[-1], theta[-1], distancia[-1])
+            self.position += len(x)
+            self.on_poses(x, y, theta, distancia)
+        elapsed = self._work.nsecsElapsed() * 1e-9
+        if self.position > start and elapsed > 0:
+            rate = (self.position - start) / elapsed
+            self._frame_records = int(min(BLOQUE, max(REGISTROS_MINIMOS, rate * PRESUPUESTO_FRAME)))
+        if self.position >= len(self.log):
+            self.stop()
+            self.finished.emit()
+
+
+class ServerMirror(QtCore.QObject):
+    """Espejo de un PoseServer: se suscribe a su estado y lo entrega a on_state a ritmo bajo.
+
+    address es "host:puerto" para TCP o la ruta de un socket Unix. El
+    socket es de Qt, así que los estados llegan en el bucle de eventos de la
+    interfaz sin hilos ni asyncio; on_state recibe el array ROBOT_ESTADO
+    más reciente de cada lectura y los intermedios se descartan.
+    """
+
+    def __init__(self, address, on_state, hz=30.0, parent=None):
+        super().__init__(parent)
+        self.on_state = on_state
+        self.hz = hz
+        self.received = 0  # estados entregados a on_state
+        self._buffer = bytearray()
+        host, _, port = address.rpartition(":")
+        if host and port.isdigit():
+            self.socket = QtNetwork.QTcpSocket(self)
+            self.socket.connected.connect(self._subscribe)
+            self.socket.connectToHost(host, int(port))
+        else:
+            self.socket = QtNetwork.QLocalSocket(self)
+            self.socket.connected.connect(self._subscribe)
+            self.socket.connectToServer(address)
+        self.socket.readyRead.connect(self._on_ready_read)
+
+    def _subscribe(self):
+        self.socket.write(frame(SUSCRIBIR, payload=struct.pack("<d", self.hz)))
+
+    def _on_ready_read(self):
+        self._buffer += self.socket.readAll().data()
+        latest = None
+        while len(self._buffer) >= CABECERA.size:
+            length, kind, _, _, _ = CABECERA.unpack_from(self._buffer)
+            end = CABECERA.size + length
+            if len(self._buffer) < end:
+                break
+            if kind == ESTADO:
+                latest = bytes(self._buffer[CABECERA.size:end])
+            del self._buffer[:end]
+        if latest is not None:
+            self.received += 1
+            self.on_state(np.frombuffer(latest, dtype=ROBOT_ESTADO))
+
+    def stop(self):
+        self.socket.abort()
@@ -0,0 +1,289 @@
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from odometria import (DIAMETRO_RUEDA_L, DIAMETRO_RUEDA_R, METODOS_INTEGRACION, RESOLUCION_ENCODER, SEPARACION_RUEDAS,
+                       check_method)
+from reproduccion import EncoderLog, csv_to_log
+
+RANGO_BARRIDO = 0.05  # ±5 % alrededor de los valores nominales
+PUNTOS_BARRIDO = 47  # por parámetro: 47**3 ≈ 10**5 candidatos
+PESO_RUMBO = 10.0  # cm de residuo por radián de error de rumbo
+ELEMENTOS_POR_BLOQUE = 2_000_000  # candidatos x tramos que se evalúan de una vez
+ITERACIONES_LM = 100
+
+
+class CalibrationRun:
+    """Una ejecución grabada (ticks) con su pose real conocida en algunos pasos.
+
+    Los ticks se comprimen en tramos de lecturas iguales consecutivas
+    (l, r, n). Dentro de un tramo el rumbo avanza a paso fijo, así que la
+    suma de los n pasos tiene forma cerrada (serie geométrica) y evaluar un
+    candidato cuesta O(tramos) en lugar de O(pasos): un cuadrado UMBmark de
+    miles de lecturas se queda en unos pocos tramos. Los pasos con pose real
+    conocida se fuerzan como límites de tramo.
+
+    truth_steps son los pasos (1..T) tras los que se conoce la pose y truth
+    un array (M, 2) con x, y o (M, 3) con x, y, theta en radianes.
+    """
+
+    def __init__(self, left_ticks, right_ticks, truth_steps, truth, pose=(0.0, 0.0, 0.0),
+                 heading_weight=PESO_RUMBO):
+        left = np.asarray(left_ticks, dtype=np.int64)
+        right = np.asarray(right_ticks, dtype=np.int64)
+        self.steps = len(left)
+        self.truth_steps = np.asarray(truth_steps, dtype=np.int64).reshape(-1)
+        self.truth = np.asarray(truth, dtype=np.float64).reshape(len(self.truth_steps), -1)
+        if self.truth.shape[1] not in (2, 3):
+            raise ValueError("La pose real debe tener columnas x, y o x, y, theta")
+        if not np.all((1 <= self.truth_steps) & (self.truth_steps <= self.steps)):
+            raise ValueError(f"Los pasos con pose real deben estar en 1..{self.steps}")
+        self.pose = tuple(float(v) for v in pose)
+        self.heading_weight = heading_weight
+
+        change = np.flatnonzero((left[1:] != left[:-1]) | (right[1:] != right[:-1])) + 1
+        starts = np.union1d(np.concatenate(([0], change)), self.truth_steps[self.truth_steps < self.steps])
+        ends = np.append(starts[1:], self.steps)
+        self.left = left[starts].astype(np.float64)
+        self.right = right[starts].astype(np.float64)
+        self.counts = (ends - starts).astype(np.float64)
+        self._targets = np.searchsorted(ends, self.truth_steps)
+
+    @classmethod
+    def from_endpoint(cls, left_ticks, right_ticks, end_pose, pose=(0.0, 0.0, 0.0), heading_weight=PESO_RUMBO):
+        """Ejecución de la que solo se conoce la pose final (x, y[, theta])."""
+        return cls(left_ticks, right_ticks, [len(left_ticks)], [end_pose], pose, heading_weight)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def poses(self, pulso_cm_l, pulso_cm_r, separacion, method="euler"):
+        """Poses (x, y, theta) al final de cada tramo, de forma (C, tramos), para C candidatos."""
+        check_method(method)
+        pulso_cm_l = np.asarray(pulso_cm_l, dtype=np.float64)[..., np.newaxis]
+        pulso_cm_r = np.asarray(pulso_cm_r, dtype=np.float64)[..., np.newaxis]
+        separacion = np.asarray(separacion, dtype=np.float64)[..., np.newaxis]
+        x0, y0, theta0 = self.pose
+        n = self.counts
+
+        dl = self.left * pulso_cm_l
+        dr = self.right * pulso_cm_r
+        dc = (dl + dr) / 2.0
+        half = (dr - dl) / (2.0 * separacion)
+        theta = theta0 + np.cumsum(2.0 * n * half, axis=-1)
+        start = theta - 2.0 * n * half
+
+        # sum_{j=1..n} exp(i (start + j dtheta)) = exp(i (start + (n + 1) h)) sin(n h) / sin(h), h = dtheta / 2;
+        # el punto medio desplaza cada rumbo -h y el arco exacto además multiplica dc por sin(h) / h.
+        denominator = half if method == "arc" else np.sin(half)
+        ratio = np.divide(np.sin(n * half), denominator, out=np.broadcast_to(n, half.shape).copy(),
+                          where=denominator != 0)
+        phase = start + (n + 1) * half if method == "euler" else start + n * half
+        step = dc * ratio
+        x = x0 + np.cumsum(step * np.cos(phase), axis=-1)
+        y = y0 + np.cumsum(step * np.sin(phase), axis=-1)
+        return x, y, theta
+
+    def residuals(self, params, method="euler", resolution=RESOLUCION_ENCODER):
+        """Residuos (C, M * columnas) en cm para candidatos (C, 3) diametro_l, diametro_r, separacion."""
+        params = np.asarray(params, dtype=np.float64).reshape(-1, 3)
+        x, y, theta = self.poses(math.pi * params[:, 0] / resolution, math.pi * params[:, 1] / resolution,
+                                 params[:, 2], method)
+        parts = [x[:, self._targets] - self.truth[:, 0], y[:, self._targets] - self.truth[:, 1]]
+        if self.truth.shape[1] == 3:
+            error = np.angle(np.exp(1j * (theta[:, self._targets] - self.truth[:, 2])))
+            parts.append(self.heading_weight * error)
+        return np.concatenate(parts, axis=1)
+
+
+@dataclass
+class Calibration:
+    """Constantes calibradas y el residuo RMS (cm) con el que reproducen las ejecuciones."""
+    diametro_l: float
+    diametro_r: float
+    separacion: float
+    resolucion: int = RESOLUCION_ENCODER
+    rms: float = math.nan
+    evaluaciones: int = 0
+
+    @property
+    def pulso_cm_l(self):
+        return math.pi * self.diametro_l / self.resolucion
+
+    @property
+    def pulso_cm_r(self):
+        return math.pi * self.diametro_r / self.resolucion
+
+    def constants(self):
+        """Las constantes de odometria.py con los valores calibrados."""
+        return (f"DIAMETRO_RUEDA_L = {self.diametro_l:.6f}  # cm\n"
+                f"DIAMETRO_RUEDA_R = {self.diametro_r:.6f}  # cm\n"
+                f"SEPARACION_RUEDAS = {self.separacion:.6f}  # cm\n"
+                f"RESOLUCION_ENCODER = {self.resolucion}  # pulsos por vuelta\n")
+
+
+def _residuals(runs, params, method, resolution):
+    return np.concatenate([run.residuals(params, method, resolution) for run in runs], axis=1)
+
+
+def _sweep_chunk(args):
+    runs, params, method, resolution = args
+    residuals = _residuals(runs, params, method, resolution)
+    return np.einsum("ij,ij->i", residuals, residuals)
+
+
+def grid_sweep(runs, center=(DIAMETRO_RUEDA_L, DIAMETRO_RUEDA_R, SEPARACION_RUEDAS), span=RANGO_BARRIDO,
+               points=PUNTOS_BARRIDO, method="euler", resolution=RESOLUCION_ENCODER, workers=None):
+    """Evalúa una rejilla points**3 alrededor de center (±span relativo).
+
+    Devuelve (candidatos (C, 3), suma de residuos al cuadrado (C,)). Los
+    candidatos se reparten en bloques entre procesos; cada bloque reutiliza
+    los tramos ya comprimidos de las ejecuciones.
+    """
+    axes = [np.linspace(c * (1 - span), c * (1 + span), points) for c in center]
+    params = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+    chunk = max(1, ELEMENTOS_POR_BLOQUE // max(1, sum(len(run) for run in runs)))
+    tasks = [(runs, params[start:start + chunk], method, resolution) for start in range(0, len(params), chunk)]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(tasks) == 1:
+        costs = list(map(_sweep_chunk, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            costs = list(pool.map(_sweep_chunk, tasks))
+    return params, np.concatenate(costs)
+
+
+def refine(runs, params, method="euler", resolution=RESOLUCION_ENCODER, iterations=ITERACIONES_LM, tol=1e-12):
+    """Ajuste por mínimos cuadrados (Levenberg-Marquardt) a partir de params (3,).
+
+    El jacobiano sale de diferencias finitas; el punto y sus tres
+    perturbaciones se evalúan en una sola llamada vectorizada. Devuelve
+    (params, suma de residuos al cuadrado, evaluaciones).
+    """
+    params = np.asarray(params, dtype=np.float64).copy()
+    residual = _residuals(runs, params, method, resolution)[0]
+    cost = residual @ residual
+    damping = 1e-3
+    evaluations = 1
+    for _ in range(iterations):
+        steps = 1e-7 * np.maximum(np.abs(params), 1.0)
+        trial = _residuals(runs, params + np.diag(steps), method, resolution)
+        evaluations += 3
+        jacobian = ((trial - residual) / steps[:, np.newaxis]).T
+        normal = jacobian.T @ jacobian
+        gradient = jacobian.T @ residual
+        while True:
+            delta = np.linalg.solve(normal + damping * np.diag(np.diag(normal) + 1e-12), -gradient)
+            candidate = params + delta
+            new_residual = _residuals(runs, candidate, method, resolution)[0]
+            evaluations += 1
+            new_cost = new_residual @ new_residual
+            if new_cost < cost:
+                damping = max(damping / 10, 1e-12)
+                break
+            damping *= 10
+            if damping > 1e12:
+                return params, cost, evaluations
+        improvement = cost - new_cost
+        params, residual, cost = candidate, new_residual, new_cost
+        if improvement <= tol * max(cost, 1e-30) or np.all(np.abs(delta) <= tol * np.abs(params)):
+            break
+    return params, cost, evaluations
+
+
+def calibrate(runs, center=(DIAMETRO_RUEDA_L, DIAMETRO_RUEDA_R, SEPARACION_RUEDAS), span=RANGO_BARRIDO,
+              points=PUNTOS_BARRIDO, method="euler", resolution=RESOLUCION_ENCODER, workers=None):
+    """Barrido en rejilla seguido de Levenberg-Marquardt desde el mejor candidato."""
+    if isinstance(runs, CalibrationRun):
+        runs = [runs]
+    params, costs = grid_sweep(runs, center, span, points, method, resolution, workers)
+    best, cost, evaluations = refine(runs, params[np.argmin(costs)], method, resolution)
+    residuals = sum(len(run.truth_steps) * run.truth.shape[1] for run in runs)
+    return Calibration(*(float(v) for v in best), resolution, math.sqrt(cost / residuals),
+                       len(params) + evaluations)
+
+
+def _load_ticks(path):
+    if path.lower().endswith(".csv"):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_path = os.path.join(tmp, "log.odolog")
+            csv_to_log(path, log_path)
+            log = EncoderLog(log_path)
+            left, right = np.array(log.left), np.array(log.right)
+            # Sin el memmap abierto, que en Windows impide borrar el directorio temporal
+            del log
+        return left, right
+    log = EncoderLog(path)
+    return np.array(log.left), np.array(log.right)
+
+
+def _load_truth(path):
+    """CSV paso,x,y[,theta] (con o sin cabecera) con la pose real tras cada paso listado."""
+    with open(path) as f:
+        first = f.readline()
+    try:
+        [float(v) for v in first.split(",")]
+        skip = 0
+    except ValueError:
+        skip = 1
+    data = np.loadtxt(path, delimiter=",", ndmin=2, skiprows=skip)
+    return data[:, 0].astype(np.int64), data[:, 1:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibra diámetros de rueda y separación a partir de logs de encoders")
+    parser.add_argument("logs", nargs="+", help="logs de encoders (.odolog o .csv)")
+    truth = parser.add_mutually_exclusive_group(required=True)
+    truth.add_argument("--final", type=float, nargs="+", metavar="V",
+                       help="pose final real x y [theta en grados], una por log y seguidas")
+    truth.add_argument("--trayectoria", nargs="+", metavar="CSV",
+                       help="CSV paso,x,y[,theta en grados] con la pose real, uno por log")
+    parser.add_argument("--pose", type=float, nargs=3, default=(0.0, 0.0, 0.0), metavar=("X", "Y", "THETA"),
+                        help="pose inicial de cada ejecución (theta en grados)")
+    parser.add_argument("--metodo", choices=METODOS_INTEGRACION, default="euler")
+    parser.add_argument("--rango", type=float, default=RANGO_BARRIDO, help="semiancho relativo del barrido")
+    parser.add_argument("--puntos", type=int, default=PUNTOS_BARRIDO, help="puntos de la rejilla por parámetro")
+    parser.add_argument("--procesos", type=int, default=None, help="procesos del barrido (por defecto, todos)")
+    parser.add_argument("--salida", help="fichero JSON donde guardar la calibración")
+    args = parser.parse_args(argv)
+
+    pose = (args.pose[0], args.pose[1], math.radians(args.pose[2]))
+    runs = []
+    if args.final is not None:
+        columns = len(args.final) // len(args.logs)
+        if columns not in (2, 3) or columns * len(args.logs) != len(args.final):
+            parser.error("--final necesita x y [theta] para cada log")
+        finals = np.reshape(args.final, (len(args.logs), columns))
+        for path, final in zip(args.logs, finals):
+            if columns == 3:
+                final = (final[0], final[1], math.radians(final[2]))
+            runs.append(CalibrationRun.from_endpoint(*_load_ticks(path), final, pose))
+    else:
+        if len(args.trayectoria) != len(args.logs):
+            parser.error("--trayectoria necesita un CSV por log")
+        for path, truth_path in zip(args.logs, args.trayectoria):
+            steps, poses = _load_truth(truth_path)
+            if poses.shape[1] == 3:
+                poses[:, 2] = np.radians(poses[:, 2])
+            runs.append(CalibrationRun(*_load_ticks(path), steps, poses, pose))
+
+    calibration = calibrate(runs, span=args.rango, points=args.puntos, method=args.metodo, workers=args.procesos)
+    print(calibration.constants(), end="")
+    print(f"# residuo RMS: {calibration.rms:.4f} cm ({calibration.evaluaciones} evaluaciones)")
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(asdict(calibration), f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
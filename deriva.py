@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+
+INTERVALO_RPE = 1000  # pasos entre las dos poses que compara el RPE
+
+
+def _relative(x0, y0, theta0, x1, y1, theta1):
+    """Movimiento de la pose 1 visto desde la pose 0: (dx, dy, dtheta) en el marco de la 0 (escalares o arrays)."""
+    cos, sin = np.cos(theta0), np.sin(theta0)
+    dx, dy = x1 - x0, y1 - y0
+    return cos * dx + sin * dy, -sin * dx + cos * dy, theta1 - theta0
+
+
+class DriftTracker:
+    """Métricas de deriva entre la pose real y la estimada, actualizadas en O(1) por paso.
+
+    ATE (error absoluto de trayectoria): RMSE y máximo de la distancia entre
+    ambas posiciones en cada paso. RPE (error relativo de pose): RMSE del
+    error del movimiento relativo cada `interval` pasos, en traslación y en
+    rotación; las poses de hace `interval` pasos se guardan en un buffer
+    circular, así que no hace falta recorrer la trayectoria.
+    """
+
+    def __init__(self, interval=INTERVALO_RPE):
+        self.interval = interval
+        self._history = np.empty((interval, 6), dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.ate_max = 0.0
+        self.position_error = 0.0
+        self.heading_error = 0.0
+        self._ate_sq = 0.0
+        self._rpe_n = 0
+        self._rpe_sq = 0.0
+        self._rpe_rot_sq = 0.0
+
+    def update(self, true_pose, estimated_pose):
+        """Añade un paso; las poses son (x, y, theta en radianes)."""
+        tx, ty, tth = true_pose
+        ex, ey, eth = estimated_pose
+        error = math.hypot(ex - tx, ey - ty)
+        self.position_error = error
+        self.heading_error = math.remainder(eth - tth, 2 * math.pi)
+        self._ate_sq += error * error
+        self.ate_max = max(self.ate_max, error)
+
+        slot = self.steps % self.interval
+        if self.steps >= self.interval:
+            otx, oty, otth, oex, oey, oeth = self._history[slot]
+            rtx, rty, rtth = _relative(otx, oty, otth, tx, ty, tth)
+            rex, rey, reth = _relative(oex, oey, oeth, ex, ey, eth)
+            self._rpe_sq += (rex - rtx) ** 2 + (rey - rty) ** 2
+            self._rpe_rot_sq += math.remainder(reth - rtth, 2 * math.pi) ** 2
+            self._rpe_n += 1
+        self._history[slot] = (tx, ty, tth, ex, ey, eth)
+        self.steps += 1
+
+    def update_batch(self, true_poses, estimated_poses):
+        """Como update para muchos pasos seguidos; cada pose es (xs, ys, thetas) con arrays."""
+        true = np.column_stack(true_poses).astype(np.float64)
+        estimated = np.column_stack(estimated_poses).astype(np.float64)
+        n = len(true)
+        if not n:
+            return
+        error = np.hypot(estimated[:, 0] - true[:, 0], estimated[:, 1] - true[:, 1])
+        self.position_error = float(error[-1])
+        self.heading_error = math.remainder(estimated[-1, 2] - true[-1, 2], 2 * math.pi)
+        self._ate_sq += float(error @ error)
+        self.ate_max = max(self.ate_max, float(error.max()))
+
+        # Historia en orden cronológico seguida de los pasos nuevos; el paso
+        # nuevo j se compara con el que está `interval` posiciones antes.
+        kept = min(self.steps, self.interval)
+        history = self._history[(self.steps - kept + np.arange(kept)) % self.interval]
+        poses = np.concatenate((history, np.hstack((true, estimated))))
+        current = np.arange(kept, kept + n)
+        current = current[current >= self.interval]
+        if len(current):
+            old, new = poses[current - self.interval], poses[current]
+            rtx, rty, rtth = _relative(*old[:, :3].T, *new[:, :3].T)
+            rex, rey, reth = _relative(*old[:, 3:].T, *new[:, 3:].T)
+            self._rpe_sq += float(((rex - rtx) ** 2 + (rey - rty) ** 2).sum())
+            self._rpe_rot_sq += float((np.angle(np.exp(1j * (reth - rtth))) ** 2).sum())
+            self._rpe_n += len(current)
+
+        last = min(n, self.interval)
+        self._history[(self.steps + n - last + np.arange(last)) % self.interval] = poses[-last:]
+        self.steps += n
+
+    @property
+    def ate_rmse(self):
+        return math.sqrt(self._ate_sq / self.steps) if self.steps else 0.0
+
+    @property
+    def rpe_rmse(self):
+        return math.sqrt(self._rpe_sq / self._rpe_n) if self._rpe_n else 0.0
+
+    @property
+    def rpe_rot_rmse(self):
+        return math.sqrt(self._rpe_rot_sq / self._rpe_n) if self._rpe_n else 0.0
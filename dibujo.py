@@ -0,0 +1,155 @@
+import numpy as np
+import shiboken6
+from PySide6 import QtGui
+
+from rastro import PUNTOS_VISIBLES
+
+# Color de cada número de pasadas por una celda (0, 1, 2, 3 o más)
+COLORES_COBERTURA = ((0, 0, 0, 0), (0, 120, 255, 70), (0, 120, 255, 130), (255, 140, 0, 150))
+
+
+def polygon_from_array(points):
+    """Crea un QPolygonF a partir de un array (N, 2) copiando la memoria de golpe."""
+    points = np.asarray(points, dtype=np.float64)
+    polygon = QtGui.QPolygonF()
+    polygon.resize(len(points))
+    if len(points):
+        buffer = shiboken6.VoidPtr(polygon.data(), points.nbytes, True)
+        np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)[:] = points
+    return polygon
+
+
+class TriangleStamper:
+    """Pinta muchos triángulos iguales con una sola escritura vectorizada.
+
+    Para cada uno de `angle_bins` ángulos se precalculan los píxeles que cubre
+    el triángulo; draw() estampa todos los robots en un buffer ARGB con un
+    único acceso indexado de NumPy y lo devuelve como QImage, de modo que la
+    flota entera se pinta con un drawImage en lugar de una llamada por robot.
+    """
+
+    def __init__(self, vertices, width, height, angle_bins=128):
+        vertices = np.asarray(vertices, dtype=np.float64)
+        self.pad = int(np.ceil(np.abs(vertices).max())) + 1
+        self.width = width + 2 * self.pad
+        self.height = height + 2 * self.pad
+        self.angle_bins = angle_bins
+        self._buffer = np.zeros((self.height, self.width), dtype=np.uint32)
+        self.image = QtGui.QImage(self._buffer.data, self.width, self.height, 4 * self.width,
+                                  QtGui.QImage.Format_ARGB32_Premultiplied)
+
+        gy, gx = np.mgrid[-self.pad:self.pad + 1, -self.pad:self.pad + 1]
+        masks = []
+        for b in range(angle_bins):
+            angle = 2 * np.pi * b / angle_bins
+            cos, sin = np.cos(angle), np.sin(angle)
+            rotated = np.column_stack((vertices[:, 0] * cos - vertices[:, 1] * sin,
+                                       vertices[:, 0] * sin + vertices[:, 1] * cos))
+            edges = []
+            for (x1, y1), (x2, y2) in zip(rotated, np.roll(rotated, -1, axis=0)):
+                edges.append((x2 - x1) * (gy - y1) - (y2 - y1) * (gx - x1))
+            edges = np.array(edges)
+            masks.append(np.flatnonzero(((edges >= 0).all(0) | (edges <= 0).all(0)).ravel()))
+        # Desplazamientos planos respecto al centro; las filas cortas se
+        # rellenan repitiendo su primer píxel, que se escribe igual dos veces.
+        longest = max(len(m) for m in masks)
+        side = 2 * self.pad + 1
+        self._offsets = np.empty((angle_bins, longest), dtype=np.intp)
+        for b, mask in enumerate(masks):
+            offsets = (mask // side - self.pad) * self.width + (mask % side - self.pad)
+            self._offsets[b, :len(offsets)] = offsets
+            self._offsets[b, len(offsets):] = offsets[0]
+
+    def draw(self, x, y, theta, argb):
+        """Estampa los robots (x, y dentro del lienzo) y devuelve la capa resultante."""
+        self._buffer.fill(0)
+        bins = (np.asarray(theta) * (self.angle_bins / (2 * np.pi)) + 0.5).astype(np.intp) % self.angle_bins
+        centers = ((np.asarray(y) + self.pad + 0.5).astype(np.intp) * self.width
+                   + (np.asarray(x) + self.pad + 0.5).astype(np.intp))
+        self._buffer.reshape(-1)[centers[:, np.newaxis] + self._offsets[bins]] = np.asarray(argb)[:, np.newaxis]
+        return self.image
+
+
+class TrailLayer:
+    """Capa persistente donde se acumula un TrailPyramid visto a través de un Viewport.
+
+    Cada llamada a update() solo dibuja los puntos añadidos desde la
+    anterior. La capa se rehace entera con el nivel de detalle adecuado
+    tras un clear() del rastro, cuando cambia la vista, cuando llegan más
+    puntos nuevos de los que se dibujarían al rehacerla o tras invalidate().
+    """
+
+    def __init__(self, color, width=2):
+        self.pen = QtGui.QPen(QtGui.QColor(color))
+        self.pen.setWidth(width)
+        self.image = None
+
+    def invalidate(self):
+        self.image = None
+
+    def update(self, trail, size, viewport):
+        rebuild = (self.image is None
+                   or self.image.size() != size
+                   or self._generation != trail.generation
+                   or self._view != viewport.version
+                   or trail.total - self._drawn > PUNTOS_VISIBLES)
+        if not rebuild and self._version == trail.version:
+            return self.image
+
+        if rebuild:
+            self.image = QtGui.QImage(size, QtGui.QImage.Format_ARGB32_Premultiplied)
+            self.image.fill(0)
+            segments = trail.visible_segments(*viewport.visible_rect())
+            lines = viewport.to_screen(segments.reshape(-1, 2))
+        else:
+            # Se repite el último punto dibujado por si el diezmado lo sustituyó
+            points = viewport.to_screen(trail.tail(trail.total - self._drawn + 2))
+            lines = np.concatenate((points[:-1], points[1:]), axis=1).reshape(-1, 2)
+
+        if len(lines):
+            painter = QtGui.QPainter(self.image)
+            painter.setPen(self.pen)
+            painter.drawLines(polygon_from_array(lines))
+            painter.end()
+
+        self._generation = trail.generation
+        self._version = trail.version
+        self._view = viewport.version
+        self._drawn = trail.total
+        return self.image
+
+
+class CoverageLayer:
+    """Imagen ARGB de una CoverageGrid, con un píxel por celda.
+
+    Solo se repinta la caja de celdas que la rejilla marca como cambiadas
+    desde la última llamada; la imagen entera se rehace únicamente cuando la
+    rejilla se vacía o se sustituye. La escala al lienzo la hace el painter
+    con la transformación del viewport.
+    """
+
+    def __init__(self, colors=COLORES_COBERTURA):
+        # Tabla de 256 colores ARGB premultiplicados indexada por número de pasadas
+        table = []
+        for color in colors:
+            color = QtGui.QColor(*color)
+            alpha = color.alpha() / 255
+            table.append((color.alpha() << 24) | (round(color.red() * alpha) << 16)
+                         | (round(color.green() * alpha) << 8) | round(color.blue() * alpha))
+        self.palette = np.array(table + [table[-1]] * (256 - len(table)), dtype=np.uint32)
+        self.image = None
+        self._grid = None
+
+    def update(self, grid):
+        if self._grid is not grid or self._generation != grid.generation:
+            self._buffer = np.zeros(grid.counts.shape, dtype=np.uint32)
+            self.image = QtGui.QImage(self._buffer.data, grid.cols, grid.rows, 4 * grid.cols,
+                                      QtGui.QImage.Format_ARGB32_Premultiplied)
+            self._grid = grid
+            self._generation = grid.generation
+            grid.dirty = (0, 0, grid.rows, grid.cols)
+        dirty = grid.take_dirty()
+        if dirty is not None:
+            r0, c0, r1, c1 = dirty
+            self._buffer[r0:r1, c0:c1] = self.palette[grid.counts[r0:r1, c0:c1]]
+        return self.image
@@ -0,0 +1,170 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from odometria import PULSO_CM_L, PULSO_CM_R, SEPARACION_RUEDAS, integrate_ticks
+
+ELEMENTOS_POR_BLOQUE = 2_000_000  # trayectorias x pasos que procesa cada bloque
+PASOS_POR_PERCENTIL = 4096  # pasos del histograma que se recorren a la vez al calcular los percentiles
+
+
+@dataclass(frozen=True)
+class ErrorModel:
+    """Fuentes de error muestreadas para cada trayectoria del ensamble.
+
+    Las desviaciones son relativas (0.01 = 1 %). El deslizamiento se aplica
+    por tick y por rueda: con probabilidad prob_deslizamiento la rueda pierde
+    una fracción uniforme entre 0 y max_deslizamiento de su avance.
+    """
+    sigma_diametro: float = 0.005
+    sigma_separacion: float = 0.01
+    sigma_ruido: float = 0.02
+    prob_deslizamiento: float = 0.001
+    max_deslizamiento: float = 0.5
+
+
+@dataclass
+class EnsembleStats:
+    """Estadísticos por paso del error de pose (estimada - nominal)."""
+    n: int
+    mean: np.ndarray  # (T, 3): error medio en x, y, theta
+    cov_xy: np.ndarray  # (T, 2, 2)
+    var_theta: np.ndarray  # (T,)
+    percentiles: dict  # percentil -> (T,) norma del error de posición
+    bin_edges: np.ndarray
+    histogram: np.ndarray  # (T, bins) conteos de la norma del error de posición, en el entero más pequeño que cabe
+
+    def ellipses(self, nsigma=2.0):
+        """Semiejes (a, b) y orientación en radianes de la elipse de covarianza."""
+        sxx = self.cov_xy[:, 0, 0]
+        syy = self.cov_xy[:, 1, 1]
+        sxy = self.cov_xy[:, 0, 1]
+        mid = (sxx + syy) / 2
+        rad = np.sqrt(((sxx - syy) / 2) ** 2 + sxy ** 2)
+        a = nsigma * np.sqrt(np.maximum(mid + rad, 0))
+        b = nsigma * np.sqrt(np.maximum(mid - rad, 0))
+        return a, b, 0.5 * np.arctan2(2 * sxy, sxx - syy)
+
+
+def _sample_ticks(rng, ticks, n, model):
+    noisy = ticks * (1 + model.sigma_ruido * rng.standard_normal((n, ticks.size)))
+    if model.prob_deslizamiento > 0:
+        slip = rng.random((n, ticks.size)) < model.prob_deslizamiento
+        noisy[slip] *= 1 - model.max_deslizamiento * rng.random(np.count_nonzero(slip))
+    return noisy
+
+
+def _run_chunk(args):
+    seed, n, left, right, reference, model, edges = args
+    rng = np.random.default_rng(seed)
+    pulso_l = PULSO_CM_L * (1 + model.sigma_diametro * rng.standard_normal(n))
+    pulso_r = PULSO_CM_R * (1 + model.sigma_diametro * rng.standard_normal(n))
+    separacion = SEPARACION_RUEDAS * (1 + model.sigma_separacion * rng.standard_normal(n))
+    x, y, theta, _ = integrate_ticks(_sample_ticks(rng, left, n, model), _sample_ticks(rng, right, n, model),
+                                     pulso_cm_l=pulso_l, pulso_cm_r=pulso_r, separacion=separacion)
+    ref_x, ref_y, ref_theta = reference
+    ex = x - ref_x
+    ey = y - ref_y
+    eth = np.angle(np.exp(1j * (theta - ref_theta)))
+
+    bins = edges.size - 1
+    # Solo el bin de cada trayectoria y paso (un byte con 256 bins): el histograma lo lleva el proceso padre
+    idx = np.clip(np.searchsorted(edges, np.hypot(ex, ey), side="right") - 1, 0, bins - 1)
+    sums = np.stack([ex.sum(0), ey.sum(0), eth.sum(0),
+                     (ex * ex).sum(0), (ey * ey).sum(0), (ex * ey).sum(0), (eth * eth).sum(0)])
+    return sums, idx.astype(np.min_scalar_type(bins - 1))
+
+
+def _add_to_histogram(histogram, idx):
+    """Suma al histograma (T, bins) los bins (n, T) de un bloque, recorriendo la dimensión más corta."""
+    n, steps = idx.shape
+    bins = histogram.shape[1]
+    if n < steps:
+        # En una trayectoria cada paso cae en una fila distinta: no hay índices repetidos
+        flat = histogram.reshape(-1)
+        offsets = bins * np.arange(steps)
+        for row in idx:
+            flat[offsets + row] += 1
+    else:
+        for step in range(steps):
+            histogram[step] += np.bincount(idx[:, step], minlength=bins).astype(histogram.dtype)
+
+
+def run_ensemble(left_ticks, right_ticks, n_trajectories=1000, model=ErrorModel(), seed=0, workers=None,
+                 percentiles=(50, 90, 95, 99), bins=256, max_error=1e4):
+    """Simula n_trajectories ejecuciones ruidosas de la misma secuencia de ticks.
+
+    Las trayectorias se reparten en bloques, cada uno con su propio flujo de
+    números aleatorios derivado de `seed`, así que el resultado no depende
+    del número de procesos. Solo se acumulan sumas e histogramas por paso, de
+    modo que la memoria no crece con n_trajectories. Los percentiles salen de
+    un histograma logarítmico entre 1e-3 y max_error cm. Cada bloque devuelve
+    solo el bin de cada trayectoria y paso y el histograma se guarda con el
+    entero más pequeño que admite n_trajectories, así que tampoco pesa más
+    que las trayectorias cuando son pocas y los pasos muchos.
+    """
+    left = np.asarray(left_ticks, dtype=np.float64)
+    right = np.asarray(right_ticks, dtype=np.float64)
+    reference = integrate_ticks(left, right)[:3]
+    edges = np.concatenate(([0.0], np.geomspace(1e-3, max_error, bins)))
+
+    chunk = max(1, min(n_trajectories, ELEMENTOS_POR_BLOQUE // max(1, left.size)))
+    sizes = [min(chunk, n_trajectories - start) for start in range(0, n_trajectories, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(s, n, left, right, reference, model, edges) for s, n in zip(seeds, sizes)]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # Los resultados se suman en un único acumulador según llegan; con
+    # procesos solo hay unos pocos bloques en vuelo a la vez, así que la
+    # memoria no crece con el número de bloques. Se suman en el orden de los
+    # bloques para que el resultado no dependa del número de procesos.
+    sums = np.zeros((7, left.size))
+    counts = np.int16 if n_trajectories < 2 ** 15 else np.int32 if n_trajectories < 2 ** 31 else np.int64
+    histogram = np.zeros((left.size, bins), dtype=counts)
+    if workers <= 1 or len(tasks) == 1:
+        for task in tasks:
+            chunk_sums, chunk_idx = _run_chunk(task)
+            sums += chunk_sums
+            _add_to_histogram(histogram, chunk_idx)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.submit(_run_chunk, task))
+                if len(pending) >= 2 * workers:
+                    chunk_sums, chunk_idx = pending.popleft().result()
+                    sums += chunk_sums
+                    _add_to_histogram(histogram, chunk_idx)
+            while pending:
+                chunk_sums, chunk_idx = pending.popleft().result()
+                sums += chunk_sums
+                _add_to_histogram(histogram, chunk_idx)
+
+    n = n_trajectories
+    mean = sums[:3].T / n
+    mx, my, mth = mean.T
+    cov_xy = np.empty((left.size, 2, 2))
+    cov_xy[:, 0, 0] = sums[3] / n - mx * mx
+    cov_xy[:, 1, 1] = sums[4] / n - my * my
+    cov_xy[:, 0, 1] = cov_xy[:, 1, 0] = sums[5] / n - mx * my
+    var_theta = sums[6] / n - mth * mth
+
+    # Los acumulados se calculan por tramos de pasos para no duplicar el histograma entero en int64
+    quantiles = {p: np.empty(left.size) for p in percentiles}
+    for begin in range(0, left.size, PASOS_POR_PERCENTIL):
+        part = histogram[begin:begin + PASOS_POR_PERCENTIL]
+        rows = np.arange(len(part))
+        cumulative = np.cumsum(part, axis=1, dtype=np.int64)
+        for p in percentiles:
+            target = p / 100 * n
+            k = np.minimum((cumulative < target).sum(axis=1), bins - 1)
+            below = np.where(k > 0, cumulative[rows, k - 1], 0)
+            inside = part[rows, k]
+            frac = np.where(inside > 0, (target - below) / np.maximum(inside, 1), 0.0)
+            quantiles[p][begin:begin + len(part)] = edges[k] + np.clip(frac, 0, 1) * (edges[k + 1] - edges[k])
+
+    return EnsembleStats(n, mean, cov_xy, var_theta, quantiles, edges, histogram)
@@ -1,50 +1,233 @@
+import argparse
 import sys
 import math
+
+import numpy as np
 from PySide6 import QtCore, QtWidgets, QtGui
 
-# Características físicas del robot
-DIAMETRO_RUEDA_L = 6.5  # cm
-DIAMETRO_RUEDA_R = 6.5  # cm
-SEPARACION_RUEDAS = 13.0  # cm
-RESOLUCION_ENCODER = 360  # pulsos por vuelta
-PULSO_CM_L = (math.pi * DIAMETRO_RUEDA_L) / RESOLUCION_ENCODER
-PULSO_CM_R = (math.pi * DIAMETRO_RUEDA_R) / RESOLUCION_ENCODER
+from bucle import FRECUENCIA_FISICA, LogPlayer, ServerMirror, SimulationLoop
+from deriva import DriftTracker
+from dibujo import CoverageLayer, TrailLayer, TriangleStamper, polygon_from_array
+from flota import FleetState
+from mapa import ObstacleMap
+from misiones import Mission, compile_mission
+from ocupacion import CoverageGrid
+from odometria import (DIAMETRO_RUEDA_R, METODOS_INTEGRACION, PULSO_CM_L, PULSO_CM_R, TAMANO_ROBOT, footprint,
+                       inside_world, step_tracks)
+from perfilado import Profiler, rss_mb
+from rastro import CAPACIDAD_RASTRO, TrailPyramid
+from reproduccion import EncoderLog, csv_to_log
+from sesion import SessionRecorder, session_state
+from sensor import EncoderModel, EncoderPair
+from telemetria import TelemetrySink
+from vista import Viewport
+
+# Comando predefinido de misiones que repite cada tecla mientras está pulsada
+TECLAS_MOVIMIENTO = {
+    QtCore.Qt.Key_W: "adelante",
+    QtCore.Qt.Key_S: "atras",
+    QtCore.Qt.Key_A: "gira_izquierda",
+    QtCore.Qt.Key_D: "gira_derecha",
+    QtCore.Qt.Key_Q: "curva_izquierda",
+    QtCore.Qt.Key_E: "curva_derecha",
+    QtCore.Qt.Key_P: "error",
+}
+RAFAGAS_TECLA = {key: compile_mission(command) for key, command in TECLAS_MOVIMIENTO.items()}
+VELOCIDADES_REPRODUCCION = {QtCore.Qt.Key_1: 1.0, QtCore.Qt.Key_2: 10.0, QtCore.Qt.Key_3: None}
+COLORES_FLOTA = ("orange", "magenta", "cyan", "yellow")
+TAMANO_FLOTA = 1000
+FRECUENCIA_LOG = 10  # Hz de refresco del panel lateral
+RAFAGAS_POR_SEGUNDO = 30  # ritmo de repetición de teclado al que equivale mantener la tecla
+TAMANO_MUNDO = (500, 500)  # cm; el robot no puede salir de este rectángulo
+ZOOM_POR_PASO = 1.25  # factor de zoom por cada paso de la rueda del ratón
+# Teclas que abren un diálogo: en el diario de sesión se guarda su resultado, no la tecla
+TECLAS_DIALOGO = (QtCore.Qt.Key_L, QtCore.Qt.Key_M, QtCore.Qt.Key_K, QtCore.Qt.Key_T)
+# Encoders con pulsos perdidos y duplicados que se activan con la tecla N
+ENCODERS_RUIDOSOS = (EncoderModel(prob_perdido=0.02, prob_duplicado=0.01),
+                     EncoderModel(diametro=DIAMETRO_RUEDA_R, prob_perdido=0.01, prob_duplicado=0.02))
 
 class SimulationWidget(QtWidgets.QWidget):
-    def __init__(self):
+    def __init__(self, trail_capacity=CAPACIDAD_RASTRO, trail_decimation=None, trail_tolerance=0.5,
+                 world_size=TAMANO_MUNDO, seed=None):
         super().__init__()
-        self.setFixedSize(500, 500)
+        self.setMinimumSize(500, 500)
+        self.resize(500, 500)
         self.setStyleSheet("background-color: black; border: 1px solid black;")
         self.robot_position = QtCore.QPointF(40, 450)
         self.robot_angle = 0  # grados
-        self.trail = [self.robot_position]
+        self.integration_method = "euler"
+        self.trail = TrailPyramid(trail_capacity, trail_decimation, trail_tolerance)
+        self.trail.append(self.robot_position.x(), self.robot_position.y())
+        # Pose real (movimiento ordenado a las ruedas) frente a la estimada por odometría
+        self.true_position = QtCore.QPointF(self.robot_position)
+        self.true_angle = self.robot_angle
+        self.true_trail = TrailPyramid(trail_capacity, trail_decimation, trail_tolerance)
+        self.true_trail.append(self.true_position.x(), self.true_position.y())
+        self.show_truth = True
+        self.drift = DriftTracker()
+        self.encoder_models = None
+        # Todo el azar (ruido de encoders, flota) sale de este generador para poder repetir una sesión
+        self.rng = np.random.default_rng(seed)
+        self._reset_encoders()
+        # Coordenadas del mundo en cm; world_size=None deja al robot moverse sin límites
+        self.world_size = world_size
+        # Cobertura de la pose estimada sobre el área del mundo (la inicial si no hay límites)
+        self.coverage = CoverageGrid(*(world_size or TAMANO_MUNDO))
+        self.coverage.start(self.robot_position.x(), self.robot_position.y())
+        self.show_coverage = True
+        self.viewport = Viewport(500, 500)
+        self._drag = None
+        self.profiler = Profiler()
+        self.show_profile = False
+        self._background = None
+        self._coverage_layer = CoverageLayer()
+        self._trail_layer = TrailLayer("white")
+        self._true_trail_layer = TrailLayer("lightgray")
+        self.fleet = None
+        self.obstacle_map = None
+        self._fleet_stamper = None
+        self._fleet_palette = np.array([QtGui.QColor(c).rgba() for c in COLORES_FLOTA], dtype=np.uint32)
 
-    def paintEvent(self, event):
-        painter = QtGui.QPainter(self)
-        painter.fillRect(self.rect(), QtGui.QColor("black"))
+    def resizeEvent(self, event):
+        self.viewport.resize(self.width(), self.height())
+        self._background = None
+        self._trail_layer.invalidate()
+        self._true_trail_layer.invalidate()
+        self._fleet_stamper = None
+        super().resizeEvent(event)
+
+    def wheelEvent(self, event):
+        position = event.position()
+        self.viewport.zoom(ZOOM_POR_PASO ** (event.angleDelta().y() / 120), position.x(), position.y())
+        self.update()
+
+    def mousePressEvent(self, event):
+        if event.button() == QtCore.Qt.LeftButton:
+            self._drag = event.position()
+
+    def mouseMoveEvent(self, event):
+        if self._drag is not None:
+            position = event.position()
+            self.viewport.pan(position.x() - self._drag.x(), position.y() - self._drag.y())
+            self._drag = position
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == QtCore.Qt.LeftButton:
+            self._drag = None
+
+    def fit_view(self):
+        """Ajusta la vista para que quepan los dos rastros enteros."""
+        boxes = [b for b in (self.trail.bounds(), self.true_trail.bounds()) if b is not None]
+        if boxes:
+            boxes = np.array(boxes)
+            self.viewport.fit(boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max())
+            self.update()
+
+    def _transform(self):
+        dx, dy = self.viewport.offset()
+        scale = self.viewport.scale
+        return QtGui.QTransform(scale, 0, 0, scale, dx, dy)
+
+    def _build_background(self):
+        # La rejilla y los obstáculos se rehacen solo cuando cambia la vista
+        self._background = QtGui.QPixmap(self.size())
+        self._background.fill(QtGui.QColor("black"))
+        self._background_view = self.viewport.version
+        painter = QtGui.QPainter(self._background)
 
-        grid_size = 50
         pen = QtGui.QPen(QtGui.QColor("green"))
         pen.setWidth(1)
         painter.setPen(pen)
-        for x in range(0, self.width(), grid_size):
-            painter.drawLine(x, 0, x, self.height())
-        for y in range(0, self.height(), grid_size):
-            painter.drawLine(0, y, self.width(), y)
+        painter.drawLines(polygon_from_array(self.viewport.grid_lines().reshape(-1, 2)))
+
+        if self.world_size is not None:
+            pen.setWidth(2)
+            painter.setPen(pen)
+            x0, y0 = self.viewport.to_screen((0, 0))
+            x1, y1 = self.viewport.to_screen(self.world_size)
+            painter.drawRect(QtCore.QRectF(x0, y0, x1 - x0, y1 - y0))
 
-        if len(self.trail) > 1:
-            pen = QtGui.QPen(QtGui.QColor("white"))
+        if self.obstacle_map is not None and len(self.obstacle_map):
+            pen = QtGui.QPen(QtGui.QColor("red"))
             pen.setWidth(2)
             painter.setPen(pen)
-            for i in range(len(self.trail) - 1):
-                painter.drawLine(self.trail[i], self.trail[i + 1])
+            painter.drawLines(polygon_from_array(self.viewport.to_screen(self.obstacle_map.segments.reshape(-1, 2))))
+        painter.end()
+
+    def set_obstacle_map(self, obstacle_map):
+        self.obstacle_map = obstacle_map
+        self._background = None
+        self.update()
+
+    def paintEvent(self, event):
+        self.profiler.frame()
+        with self.profiler.span("pintar"):
+            self._paint()
+        if self.show_profile:
+            self._paint_profile()
+
+    def _paint_profile(self):
+        painter = QtGui.QPainter(self)
+        painter.setFont(QtGui.QFont("monospace", 8))
+        lines = self.profiler.report_lines() if self.profiler.enabled else ["Perfilado desactivado"]
+        height = painter.fontMetrics().height()
+        width = max(painter.fontMetrics().horizontalAdvance(line) for line in lines)
+        painter.fillRect(4, 4, width + 8, height * len(lines) + 8, QtGui.QColor(0, 0, 0, 180))
+        painter.setPen(QtGui.QColor("white"))
+        for i, line in enumerate(lines):
+            painter.drawText(8, 8 + height * i + painter.fontMetrics().ascent(), line)
+        painter.end()
+
+    def _paint(self):
+        if self._background is None or self._background_view != self.viewport.version:
+            self._build_background()
+
+        painter = QtGui.QPainter(self)
+        painter.drawPixmap(0, 0, self._background)
+        if self.show_coverage:
+            coverage = self.coverage
+            painter.setTransform(self._transform())
+            painter.drawImage(QtCore.QRectF(0, 0, coverage.cols * coverage.cell, coverage.rows * coverage.cell),
+                              self._coverage_layer.update(coverage))
+            painter.resetTransform()
+        if self.show_truth:
+            painter.drawImage(0, 0, self._true_trail_layer.update(self.true_trail, self.size(), self.viewport))
+        painter.drawImage(0, 0, self._trail_layer.update(self.trail, self.size(), self.viewport))
+
+        if self.fleet is not None:
+            # Toda la flota se estampa en una capa y se pinta con un solo drawImage
+            if self._fleet_stamper is None:
+                size = TAMANO_ROBOT
+                self._fleet_stamper = TriangleStamper([(size, 0), (-size / 2, -size / 2), (-size / 2, size / 2)],
+                                                      self.width(), self.height())
+            # Los robots de la flota mantienen su tamaño en pantalla con cualquier zoom
+            fleet = self.fleet
+            screen = self.viewport.to_screen(np.column_stack((fleet.x, fleet.y)))
+            shown = ((screen[:, 0] >= 0) & (screen[:, 0] < self.width())
+                     & (screen[:, 1] >= 0) & (screen[:, 1] < self.height()))
+            layer = self._fleet_stamper.draw(screen[shown, 0], screen[shown, 1], fleet.theta[shown],
+                                             self._fleet_palette[fleet.color[shown]])
+            painter.drawImage(-self._fleet_stamper.pad, -self._fleet_stamper.pad, layer)
+
+        painter.setTransform(self._transform())
+        if self.show_truth:
+            # La pose real se dibuja solo con el contorno, bajo la estimada
+            painter.setBrush(QtCore.Qt.NoBrush)
+            pen = QtGui.QPen(QtGui.QColor("lightgray"), 2)
+            pen.setCosmetic(True)
+            painter.setPen(pen)
+            painter.drawPolygon(self._robot_polygon(self.true_position, self.true_angle))
 
         painter.setBrush(QtGui.QBrush(QtGui.QColor("blue")))
         painter.setPen(QtGui.QPen(QtCore.Qt.NoPen))
+        painter.drawPolygon(self._robot_polygon(self.robot_position, self.robot_angle))
+        painter.end()
 
+    @staticmethod
+    def _robot_polygon(center, angle):
         size = 15
-        angle_rad = math.radians(self.robot_angle)
-        center = self.robot_position
+        angle_rad = math.radians(angle)
 
         points = [
             QtCore.QPointF(size, 0),
@@ -58,127 +241,570 @@ class SimulationWidget(QtWidgets.QWidget):
             rotated_y = point.x() * math.sin(angle_rad) + point.y() * math.cos(angle_rad)
             rotated_points.append(center + QtCore.QPointF(rotated_x, rotated_y))
 
-        triangle = QtGui.QPolygonF(rotated_points)
-        painter.drawPolygon(triangle)
+        return QtGui.QPolygonF(rotated_points)
+
+    def set_encoder_models(self, models):
+        """Modelos (izquierdo, derecho) de los encoders que leen la pose estimada, o None para ticks exactos."""
+        self.encoder_models = models
+        self._reset_encoders()
+
+    def _reset_encoders(self):
+        self.encoders = None if self.encoder_models is None else EncoderPair(*self.encoder_models, seed=self.rng)
+        self._wheel_cm = (0.0, 0.0)  # recorrido real acumulado de cada rueda
+
+    def _read_encoders(self, left_ticks, right_ticks):
+        left_cm = self._wheel_cm[0] + left_ticks * PULSO_CM_L
+        right_cm = self._wheel_cm[1] + right_ticks * PULSO_CM_R
+        self._wheel_cm = (left_cm, right_cm)
+        _, left, right = self.encoders.ticks_block(np.array([left_cm]), np.array([right_cm]))
+        return int(left[0]), int(right[0])
 
     def move_by_encoders(self, left_ticks, right_ticks, simulate_error=False):
-        dl = left_ticks * PULSO_CM_L
-        dr = right_ticks * PULSO_CM_R
+        # La pose real sigue exactamente los ticks ordenados y es la que choca
+        # con bordes y obstáculos; la estimada integra lo que leen los
+        # encoders y, con simulate_error, la rueda derecha corrupta.
+        # Devuelve la distancia comandada, o None si el movimiento se rechaza.
+        with self.profiler.span("integrar"):
+            step = step_tracks((self.true_position.x(), self.true_position.y(), self.true_angle),
+                               (self.robot_position.x(), self.robot_position.y(), self.robot_angle),
+                               left_ticks, right_ticks, simulate_error, self.integration_method, self.world_size,
+                               self.obstacle_map, None if self.encoders is None else self._read_encoders)
+        if step is None:
+            return None  # Movimiento fuera de límites o contra un obstáculo
 
-        if simulate_error:
-            dr *= 0.7
+        (x, y, self.true_angle, new_angle), (ex, ey, self.robot_angle, estimated_angle), recorrido = step
+        self.true_position = QtCore.QPointF(x, y)
+        self.robot_position = QtCore.QPointF(ex, ey)
+        with self.profiler.span("rastro"):
+            self.true_trail.append(x, y)
+            self.trail.append(ex, ey)
+            self.coverage.move_to(ex, ey)
+            self.drift.update((x, y, new_angle), (ex, ey, estimated_angle))
+        return recorrido
 
-        dc = (dl + dr) / 2.0
-        dtheta = (dr - dl) / SEPARACION_RUEDAS
+    def free_steps(self, xs, ys, thetas):
+        """Cuántas poses reales seguidas, desde la actual, se pueden recorrer sin salir del mundo ni chocar.
 
-        angle_rad = math.radians(self.robot_angle)
-        new_angle = angle_rad + dtheta
+        Es la misma comprobación que move_by_encoders hace paso a paso, en
+        una pasada vectorizada: primero los límites y después las huellas
+        consecutivas contra el plano, solo hasta el primer paso fuera.
+        """
+        n = len(xs)
+        outside = np.flatnonzero(~inside_world(xs, ys, self.world_size))
+        if len(outside):
+            n = outside[0]
+        if self.obstacle_map is not None and n:
+            start = np.array([(self.true_position.x(), self.true_position.y(), math.radians(self.true_angle))])
+            poses = np.concatenate((start, np.column_stack((xs[:n], ys[:n], thetas[:n]))))
+            footprints = footprint(poses[:, 0], poses[:, 1], poses[:, 2])
+            hit = np.flatnonzero(self.obstacle_map.collides_batch(footprints[:-1], footprints[1:]))
+            if len(hit):
+                n = hit[0]
+        return int(n)
 
-        dx = dc * math.cos(new_angle)
-        dy = dc * math.sin(new_angle)
+    def set_pose(self, x, y, angle, trail=None):
+        # Ambas poses vuelven a coincidir y la deriva empieza de cero
+        self.robot_position = QtCore.QPointF(x, y)
+        self.robot_angle = angle % 360
+        self.true_position = QtCore.QPointF(x, y)
+        self.true_angle = self.robot_angle
+        self.drift.reset()
+        self._reset_encoders()
+        for buffer in (self.trail, self.true_trail):
+            buffer.clear()
+            if trail is None:
+                buffer.append(x, y)
+            else:
+                buffer.extend(*trail)
+        if trail is None:
+            self.coverage.start(x, y)
+        else:
+            self.coverage.clear()
+            self.coverage.extend(*trail)
 
-        new_pos = self.robot_position + QtCore.QPointF(dx, dy)
+    def append_poses(self, xs, ys, thetas, truth=None):
+        # Poses ya integradas (p. ej. de un log o una misión): se aceptan sin
+        # comprobar límites; quien las integra recorta antes con free_steps().
+        # Un log no trae la pose real, así que sin truth ambas pistas siguen a
+        # las poses estimadas.
+        self.robot_position = QtCore.QPointF(xs[-1], ys[-1])
+        self.robot_angle = math.degrees(thetas[-1]) % 360
+        self.trail.extend(xs, ys)
+        self.coverage.extend(xs, ys)
+        if truth is None:
+            truth = (xs, ys, thetas)
+        else:
+            self.drift.update_batch(truth, (xs, ys, thetas))
+        true_xs, true_ys, true_thetas = truth
+        self.true_position = QtCore.QPointF(true_xs[-1], true_ys[-1])
+        self.true_angle = math.degrees(true_thetas[-1]) % 360
+        self.true_trail.extend(true_xs, true_ys)
 
-        if 0 < new_pos.x() < self.width() and 0 < new_pos.y() < self.height():
-            self.robot_position = new_pos
-            self.robot_angle = math.degrees(new_angle) % 360
-            self.trail.append(self.robot_position)
-            return True  # Movimiento válido
-        return False  # Movimiento fuera de límites
+    def set_trail_capacity(self, capacity):
+        """Agranda los rastros para que quepan `capacity` puntos; los vacía, así que va antes de set_pose()."""
+        if capacity <= self.trail.capacity:
+            return
+        trail = self.trail
+        self.trail = TrailPyramid(capacity, trail.decimation, trail.tolerance)
+        self.true_trail = TrailPyramid(capacity, trail.decimation, trail.tolerance)
+        self._trail_layer.invalidate()
+        self._true_trail_layer.invalidate()
 
     def reset(self):
-        self.robot_position = QtCore.QPointF(40, 450)
-        self.robot_angle = 0
-        self.trail = [self.robot_position]
+        self.set_pose(40, 450, 0)
         self.update()
 
 class MainWindow(QtWidgets.QMainWindow):
     orientacionRobot = 0
     recorridoRobot = 0
     textoLog = f"Orientacion: {orientacionRobot}\nRecorrido: {recorridoRobot}\n"
-    controlInfo = """W: mueve hacia adelante\nA: gira sobre eje izquierda\nS: mueve hacia atras\nD: gira sobre eje derecha\nQ: gira suavemente a la izquierda avanzando\nE: gira suavemente a la derecha avanzando\nR: reinicia la posicion y orientacion\nP: simula error"""
+    controlInfo = """W: mueve hacia adelante\nA: gira sobre eje izquierda\nS: mueve hacia atras\nD: gira sobre eje derecha\nQ: gira suavemente a la izquierda avanzando\nE: gira suavemente a la derecha avanzando\nR: reinicia la posicion y orientacion\nP: simula error\nL: reproduce un log de encoders\n1/2/3: reproduce a 1x/10x/maxima velocidad\nF: activa o quita una flota de robots\nI: cambia el metodo de integracion\nM: carga un plano de obstaculos\nN: activa o quita el ruido de los encoders\nG: muestra u oculta la pose real\nC: muestra u oculta la cobertura\nV: ajusta la vista al rastro (rueda: zoom, arrastrar: mover)\nK: ejecuta un fichero de mision\nO: muestra el perfilado, T: exporta la traza"""
 
-    def __init__(self):
+    def __init__(self, telemetry_dir=None, world_size=TAMANO_MUNDO, trace_path=None, session_path=None, seed=None,
+                 physics_hz=FRECUENCIA_FISICA):
         super().__init__()
         self.setWindowTitle("Simulador odometria")
 
         central_widget = QtWidgets.QWidget()
         self.setCentralWidget(central_widget)
-        self.simulation_widget = SimulationWidget()
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.simulation_widget = SimulationWidget(trail_decimation="colineal", trail_tolerance=0.05,
+                                                  world_size=world_size, seed=seed)
 
         main_layout = QtWidgets.QHBoxLayout(central_widget)
         rightLayout = QtWidgets.QVBoxLayout()
 
         self.infoSquare = QtWidgets.QLabel(self.controlInfo, alignment=QtCore.Qt.AlignLeft)
         self.infoSquare.setAlignment(QtCore.Qt.AlignTop)
-        self.infoSquare.setFixedSize(300, 200)
+        self.infoSquare.setFixedSize(300, 425)
         self.infoSquare.setWordWrap(True)
         self.infoSquare.setStyleSheet("border: 1px solid black; background-color: lightgray; font-size: 14px;")
 
         self.log_sidebar = QtWidgets.QLabel(self.textoLog, alignment=QtCore.Qt.AlignLeft)
-        self.log_sidebar.setFixedSize(300, 400)
+        self.log_sidebar.setFixedSize(300, 205)
         self.log_sidebar.setWordWrap(True)
         self.log_sidebar.setStyleSheet("border: 1px solid black; background-color: lightgray; font-size: 14px;")
 
         rightLayout.addWidget(self.infoSquare, alignment=QtCore.Qt.AlignTop | QtCore.Qt.AlignRight)
         rightLayout.addWidget(self.log_sidebar)
 
-        main_layout.addWidget(self.simulation_widget)
+        self.scrubber = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.scrubber.setEnabled(False)
+        self.scrubber.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.scrubber.valueChanged.connect(self.desplazar_reproduccion)
+
+        leftLayout = QtWidgets.QVBoxLayout()
+        leftLayout.addWidget(self.simulation_widget)
+        leftLayout.addWidget(self.scrubber)
+
+        main_layout.addLayout(leftLayout)
         main_layout.addLayout(rightLayout)
 
+        self.teclas_pulsadas = {}
+        self.player = None
+        self.espejo = None
+        self.telemetria = TelemetrySink(telemetry_dir) if telemetry_dir else None
+        # Muestras de telemetría que no vienen de un paso de física; el paso de
+        # la telemetría es loop.ticks más estas, así que nunca se repite
+        self.pasos_extra = 0
+        self.loop = SimulationLoop(self.mover, self.renderizar, physics_hz=physics_hz, parent=self)
+        # Con session_path se graba el diario de la sesión para repetirla con sesion.py
+        self.grabacion = None
+        if session_path is not None:
+            self.grabacion = SessionRecorder(session_path, {
+                "semilla": seed, "mundo": world_size, "frecuencia_fisica": physics_hz})
+        # Un solo perfilador para la ventana y el lienzo; con trace_path se activa
+        # desde el arranque y la traza se escribe al cerrar.
+        self.perfil = Profiler(enabled=trace_path is not None, frame_hz=self.loop.render_hz)
+        self.simulation_widget.profiler = self.perfil
+        self.trace_path = trace_path
+        self.loop.start()
+
+        # El panel lateral se refresca a ritmo fijo, no en cada paso ni en cada frame
+        self.log_timer = QtCore.QTimer(self)
+        self.log_timer.setInterval(1000 // FRECUENCIA_LOG)
+        self.log_timer.timeout.connect(self.actualizar_log)
+        self.log_timer.start()
+
     def actualizar_log(self):
+        with self.perfil.span("panel"):
+            self._actualizar_log()
+        if self.perfil.enabled:
+            widget = self.simulation_widget
+            self.perfil.counter("rastro_puntos", len(widget.trail) + len(widget.true_trail))
+            self.perfil.counter("rastro_MB", (widget.trail.nbytes + widget.true_trail.nbytes) / 2 ** 20)
+            memory = rss_mb()
+            if memory is not None:
+                self.perfil.counter("memoria_MB", memory)
+            if widget.show_profile:
+                self.loop.request_render()
+
+    def _actualizar_log(self):
         self.orientacionRobot = round(self.simulation_widget.robot_angle, 2)
         self.textoLog = f"Orientacion: {self.orientacionRobot:.2f}\u00b0\nRecorrido: {self.recorridoRobot:.2f} cm\n"
+        self.textoLog += f"Integracion: {self.simulation_widget.integration_method}\n"
+        drift = self.simulation_widget.drift
+        self.textoLog += (f"\nError actual: {drift.position_error:.2f} cm, {math.degrees(drift.heading_error):.2f}\u00b0\n"
+                          f"ATE: {drift.ate_rmse:.2f} cm (max {drift.ate_max:.2f} cm)\n"
+                          f"RPE/{drift.interval} pasos: {drift.rpe_rmse:.2f} cm, "
+                          f"{math.degrees(drift.rpe_rot_rmse):.2f}\u00b0\n")
+        coverage = self.simulation_widget.coverage
+        self.textoLog += (f"Cobertura: {100 * coverage.coverage:.1f} % (solape {100 * coverage.overlap:.1f} %, "
+                          f"{coverage.revisits} revisitas)\n")
+        # El rastro solo guarda los últimos trail.capacity puntos
+        trail = self.simulation_widget.trail
+        self.textoLog += f"Rastro: {len(trail)} puntos de {trail.capacity}"
+        self.textoLog += f" ({trail.first} perdidos)\n" if trail.first else "\n"
+        stats = self.loop.stats()
+        self.textoLog += (f"Jitter fisica: {stats['jitter_medio_ms']:.2f} ms (max {stats['jitter_max_ms']:.2f} ms)\n"
+                          f"Overruns: {stats['overruns']} ({stats['pasos_descartados']} pasos descartados)\n")
         self.log_sidebar.setText(self.textoLog)
 
+    def mover(self, left_ticks, right_ticks, simulate_error=False):
+        widget = self.simulation_widget
+        recorrido = widget.move_by_encoders(left_ticks, right_ticks, simulate_error)
+        if recorrido is not None:
+            self.recorridoRobot += recorrido
+        if self.telemetria is not None:
+            with self.perfil.span("telemetria"):
+                self.telemetria.record(self.loop.ticks + self.pasos_extra, widget.robot_position.x(),
+                                       widget.robot_position.y(), widget.robot_angle, self.recorridoRobot,
+                                       simulate_error)
+
+    def _pasos_telemetria(self, n):
+        """Pasos de la sesión para n muestras seguidas que no salen de la física (logs, misiones)."""
+        first = self.loop.ticks + self.pasos_extra
+        self.pasos_extra += n
+        return np.arange(first, first + n)
+
+    def mover_flota(self, dt):
+        fleet = self.simulation_widget.fleet
+        with self.perfil.span("flota"):
+            accepted = fleet.advance(dt, self.simulation_widget.world_size or TAMANO_MUNDO,
+                                     self.simulation_widget.integration_method, self.simulation_widget.obstacle_map)
+        # Los robots que chocan con el borde o con un obstáculo dan media vuelta
+        fleet.theta[~accepted] += math.pi
+
+    def alternar_flota(self):
+        if self.simulation_widget.fleet is None:
+            width, height = self.simulation_widget.world_size or TAMANO_MUNDO
+            self.simulation_widget.fleet = FleetState.random(TAMANO_FLOTA, width, height, len(COLORES_FLOTA),
+                                                             self.simulation_widget.rng)
+            self.loop.fleet_fn = self.mover_flota
+        else:
+            self.simulation_widget.fleet = None
+            self.loop.fleet_fn = None
+        self.loop.request_render()
+
+    def renderizar(self):
+        self.simulation_widget.update()
+
+    def abrir_log(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Abrir log de encoders", "",
+                                                        "Logs de encoders (*.odolog *.csv)")
+        if path:
+            self.reproducir(path)
+
+    def abrir_mapa(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Abrir plano de obstaculos", "", "Planos (*.json)")
+        if path:
+            obstacle_map = ObstacleMap.load(path)
+            if self.grabacion is not None:
+                self.grabacion.obstacle_map(self.loop.ticks, obstacle_map.segments)
+            self.simulation_widget.set_obstacle_map(obstacle_map)
+
+    def abrir_mision(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Abrir mision", "", "Misiones (*.txt *.mision)")
+        if path:
+            try:
+                done, steps = self.ejecutar_mision(path)
+            except ValueError as error:
+                QtWidgets.QMessageBox.warning(self, "Mision no valida", str(error))
+                return
+            if done < steps:
+                QtWidgets.QMessageBox.information(
+                    self, "Mision interrumpida", f"El robot choco o llego al borde tras {done} de {steps} pasos")
+
+    def ejecutar_mision(self, path):
+        with open(path) as f:
+            return self.ejecutar_texto_mision(f.read())
+
+    def ejecutar_texto_mision(self, source):
+        """Compila una misión y la integra de una pasada desde la pose actual; devuelve (pasos hechos, pasos).
+
+        Como con las teclas, la pose real no sale del mundo ni atraviesa
+        obstáculos: la misión se corta en el primer paso que lo haría.
+        """
+        mission = compile_mission(source)
+        if not len(mission):
+            return 0, 0
+        if self.grabacion is not None:
+            self.grabacion.mission(self.loop.ticks, source)
+        self.detener_reproduccion()
+        widget = self.simulation_widget
+        method = widget.integration_method
+        true_position = widget.true_position
+        truth = mission.run((true_position.x(), true_position.y(), math.radians(widget.true_angle), 0.0), method,
+                            simulate_error=False)[:3]
+        done = widget.free_steps(*truth)
+        if done:
+            executed = Mission(mission.left[:done], mission.right[:done], mission.error[:done])
+            position = widget.robot_position
+            x, y, theta, distancia = executed.run((position.x(), position.y(), math.radians(widget.robot_angle),
+                                                   self.recorridoRobot), method)
+            widget.append_poses(x, y, theta, tuple(track[:done] for track in truth))
+            self.recorridoRobot = distancia[-1]
+            if self.telemetria is not None:
+                self.telemetria.record_batch(self._pasos_telemetria(done), x, y, np.degrees(theta) % 360,
+                                             distancia, executed.error)
+        self.loop.request_render()
+        return done, len(mission)
+
+    def reproducir(self, path):
+        if path.lower().endswith(".csv"):
+            log_path = path[:-4] + ".odolog"
+            csv_to_log(path, log_path)
+            path = log_path
+
+        self.detener_reproduccion()
+        if self.grabacion is not None:
+            self.grabacion.log_replay(self.loop.ticks)
+        # La física se para mientras manda el log; el render sigue para las teclas de vista
+        self.loop.pause()
+        self.soltar_teclas()
+        log = EncoderLog(path)
+        # Todo el log tiene que caber en el rastro, que si no pierde su principio
+        self.simulation_widget.set_trail_capacity(len(log) + 1)
+        self.simulation_widget.reset()
+        self.recorridoRobot = 0
+
+        position = self.simulation_widget.robot_position
+        self.player = LogPlayer(log, self.poses_reproducidas, self.salto_reproduccion,
+                                pose=(position.x(), position.y(), math.radians(self.simulation_widget.robot_angle), 0.0),
+                                method=self.simulation_widget.integration_method, parent=self)
+        self.player.finished.connect(self.fin_reproduccion)
+        self.scrubber.blockSignals(True)
+        self.scrubber.setRange(0, len(self.player.log))
+        self.scrubber.setValue(0)
+        self.scrubber.blockSignals(False)
+        self.scrubber.setEnabled(True)
+        self.player.start()
+
+    def espejar(self, address):
+        """Muestra los robots de un servidor de poses en lugar del robot local."""
+        self.detener_reproduccion()
+        self.detener_espejo()
+        # Como al reproducir un log: sin física local, pero se sigue pintando
+        self.loop.pause()
+        self.soltar_teclas()
+        self.simulation_widget.reset()
+        self.recorridoRobot = 0
+        self.espejo = ServerMirror(address, self.estado_servidor, parent=self)
+
+    def estado_servidor(self, states):
+        # El primer robot ocupa el lugar del local; el resto se pinta como una flota
+        widget = self.simulation_widget
+        first = states[:1]
+        if len(first):
+            if self.espejo.received == 1:
+                # El rastro empieza donde está el robot, no en la pose local de partida
+                widget.set_pose(float(first["x"][0]), float(first["y"][0]), float(first["angle"][0]))
+            widget.append_poses(first["x"], first["y"], np.radians(first["angle"]),
+                                (first["true_x"], first["true_y"], np.radians(first["true_angle"])))
+            self.recorridoRobot = float(first["recorrido"][0])
+        others = states[1:]
+        widget.fleet = FleetState(len(others), others["x"], others["y"], np.radians(others["angle"]),
+                                  color=others["robot"] % len(COLORES_FLOTA)) if len(others) else None
+        self.renderizar()
+
+    def detener_espejo(self):
+        if self.espejo is not None:
+            self.espejo.stop()
+            self.espejo = None
+
+    def fin_reproduccion(self):
+        # El robot sigue desde la última pose reproducida, que ya es la del widget
+        if not self.loop.is_running():
+            self.loop.start()
+        self.loop.request_render()
+
+    def detener_reproduccion(self):
+        if self.player is not None:
+            self.player.stop()
+            self.player.deleteLater()
+            self.player = None
+            self.scrubber.setEnabled(False)
+
+    def poses_reproducidas(self, x, y, theta, distancia):
+        with self.perfil.span("reproduccion"):
+            self.simulation_widget.append_poses(x, y, theta)
+        self.recorridoRobot = distancia[-1]
+        if self.telemetria is not None:
+            with self.perfil.span("telemetria"):
+                self.telemetria.record_batch(self._pasos_telemetria(len(x)), x, y, np.degrees(theta) % 360,
+                                             distancia)
+        self.scrubber.blockSignals(True)
+        self.scrubber.setValue(self.player.position)
+        self.scrubber.blockSignals(False)
+        self.renderizar()
+
+    def salto_reproduccion(self, x, y, theta, distancia):
+        trail = self.player.checkpoints.trail_until(self.player.position)
+        self.simulation_widget.set_pose(x, y, math.degrees(theta), trail)
+        self.recorridoRobot = distancia
+        self.renderizar()
+
+    def desplazar_reproduccion(self, step):
+        if self.player is not None:
+            self.player.seek_index(step)
+            # El salto se queda en lo que ya tienen calculado los checkpoints
+            self.scrubber.blockSignals(True)
+            self.scrubber.setValue(self.player.position)
+            self.scrubber.blockSignals(False)
+
+    def actualizar_velocidades(self):
+        # Manda la última tecla de movimiento que siga pulsada
+        if self.teclas_pulsadas:
+            burst = RAFAGAS_TECLA[next(reversed(self.teclas_pulsadas))]
+            self.loop.set_wheel_speeds(burst.left[0] * RAFAGAS_POR_SEGUNDO, burst.right[0] * RAFAGAS_POR_SEGUNDO,
+                                       bool(burst.error[0]))
+        else:
+            self.loop.set_wheel_speeds(0, 0)
+
     def keyPressEvent(self, event):
-        key = event.key()
-        moved = False
-        movimiento_exitoso = False
-
-        if key == QtCore.Qt.Key_W:
-            movimiento_exitoso = self.simulation_widget.move_by_encoders(10, 10)
-            if movimiento_exitoso:
-                self.recorridoRobot += ((10 * PULSO_CM_R + 10 * PULSO_CM_L) / 2)
-            moved = True
-        elif key == QtCore.Qt.Key_S:
-            movimiento_exitoso = self.simulation_widget.move_by_encoders(-10, -10)
-            if movimiento_exitoso:
-                self.recorridoRobot += ((10 * PULSO_CM_R + 10 * PULSO_CM_L) / 2)
-            moved = True
-        elif key == QtCore.Qt.Key_A:
-            self.simulation_widget.move_by_encoders(10, -10)
-            moved = True
-        elif key == QtCore.Qt.Key_D:
-            self.simulation_widget.move_by_encoders(-10, 10)
-            moved = True
-        elif key == QtCore.Qt.Key_Q:
-            movimiento_exitoso = self.simulation_widget.move_by_encoders(10, 7)
-            if movimiento_exitoso:
-                self.recorridoRobot += ((10 * PULSO_CM_L + 7 * PULSO_CM_R) / 2)
-            moved = True
-        elif key == QtCore.Qt.Key_E:
-            movimiento_exitoso = self.simulation_widget.move_by_encoders(7, 10)
-            if movimiento_exitoso:
-                self.recorridoRobot += ((7 * PULSO_CM_L + 10 * PULSO_CM_R) / 2)
-            moved = True
-        elif key == QtCore.Qt.Key_P:
-            movimiento_exitoso = self.simulation_widget.move_by_encoders(10, 10, simulate_error=True)
-            if movimiento_exitoso:
-                self.recorridoRobot += ((10 * PULSO_CM_L + 10 * PULSO_CM_R) / 2)
-            moved = True
+        if event.isAutoRepeat():
+            return
+        if self.grabacion is not None and event.key() not in TECLAS_DIALOGO:
+            self.grabacion.key_pressed(self.loop.ticks, event.key())
+        with self.perfil.span("teclado"):
+            self._procesar_tecla(event.key())
+
+    def _procesar_tecla(self, key):
+        if key in TECLAS_DIALOGO:
+            # El diálogo se queda con las teclas y su soltado no llegaría a la ventana
+            self.soltar_teclas()
+        if key in TECLAS_MOVIMIENTO:
+            self.teclas_pulsadas[key] = None
+            self.actualizar_velocidades()
         elif key == QtCore.Qt.Key_R:
+            self.soltar_teclas()
+            self.detener_reproduccion()
+            self.detener_espejo()
             self.simulation_widget.reset()
             self.recorridoRobot = 0
-            moved = True
+            if not self.loop.is_running():
+                self.loop.start()
+            self.loop.request_render()
+        elif key == QtCore.Qt.Key_L:
+            self.abrir_log()
+        elif key == QtCore.Qt.Key_F:
+            self.alternar_flota()
+        elif key == QtCore.Qt.Key_M:
+            self.abrir_mapa()
+        elif key == QtCore.Qt.Key_K:
+            self.abrir_mision()
+        elif key == QtCore.Qt.Key_O:
+            # El overlay activa el perfilado; al quitarlo se desactiva salvo si se pidió una traza
+            widget = self.simulation_widget
+            widget.show_profile = not widget.show_profile
+            if widget.show_profile and not self.perfil.enabled:
+                self.perfil.reset()
+            self.perfil.enabled = widget.show_profile or self.trace_path is not None
+            self.loop.request_render()
+        elif key == QtCore.Qt.Key_T:
+            self.exportar_traza()
+        elif key == QtCore.Qt.Key_N:
+            widget = self.simulation_widget
+            widget.set_encoder_models(None if widget.encoder_models else ENCODERS_RUIDOSOS)
+        elif key == QtCore.Qt.Key_V:
+            self.simulation_widget.fit_view()
+        elif key == QtCore.Qt.Key_C:
+            self.simulation_widget.show_coverage = not self.simulation_widget.show_coverage
+            self.loop.request_render()
+        elif key == QtCore.Qt.Key_G:
+            self.simulation_widget.show_truth = not self.simulation_widget.show_truth
+            self.loop.request_render()
+        elif key == QtCore.Qt.Key_I:
+            widget = self.simulation_widget
+            index = METODOS_INTEGRACION.index(widget.integration_method)
+            widget.integration_method = METODOS_INTEGRACION[(index + 1) % len(METODOS_INTEGRACION)]
+            self.loop.request_render()
+        elif key in VELOCIDADES_REPRODUCCION and self.player is not None:
+            self.player.set_speed(VELOCIDADES_REPRODUCCION[key])
+
+    def keyReleaseEvent(self, event):
+        if event.isAutoRepeat():
+            return
+        if self.grabacion is not None and event.key() in self.teclas_pulsadas:
+            self.grabacion.key_released(self.loop.ticks, event.key())
+        self._soltar_tecla(event.key())
+
+    def _soltar_tecla(self, key):
+        if self.teclas_pulsadas.pop(key, False) is None:
+            self.actualizar_velocidades()
+
+    def soltar_teclas(self):
+        """Suelta todas las teclas de movimiento y lo apunta en la grabación como si se hubieran levantado."""
+        if self.grabacion is not None:
+            for key in self.teclas_pulsadas:
+                self.grabacion.key_released(self.loop.ticks, key)
+        self.teclas_pulsadas.clear()
+        self.actualizar_velocidades()
 
-        if moved:
-            self.simulation_widget.update()
-            self.actualizar_log()
+    def focusOutEvent(self, event):
+        self.soltar_teclas()
+        super().focusOutEvent(event)
+
+    def changeEvent(self, event):
+        # Con la ventana en segundo plano los keyReleaseEvent ya no llegan
+        if event.type() == QtCore.QEvent.ActivationChange and not self.isActiveWindow():
+            self.soltar_teclas()
+        super().changeEvent(event)
+
+    def exportar_traza(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Guardar traza de perfilado", "traza.json",
+                                                        "Trazas de Chrome (*.json)")
+        if path:
+            self.perfil.export_chrome_trace(path)
+
+    def closeEvent(self, event):
+        self.loop.stop()
+        self.detener_reproduccion()
+        self.detener_espejo()
+        if self.grabacion is not None:
+            self.grabacion.close(session_state(self))
+            self.grabacion = None
+        if self.trace_path is not None:
+            self.perfil.export_chrome_trace(self.trace_path)
+            self.trace_path = None
+        if self.telemetria is not None:
+            self.telemetria.close()
+            self.telemetria = None
+        super().closeEvent(event)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador de odometria diferencial")
+    parser.add_argument("log", nargs="?", help="log de encoders (.odolog o .csv) a reproducir al arrancar")
+    parser.add_argument("--telemetria", metavar="DIR", help="directorio donde guardar la telemetria de poses")
+    parser.add_argument("--mision", metavar="FICHERO", help="mision a ejecutar al arrancar")
+    parser.add_argument("--perfil", metavar="FICHERO", help="perfila desde el arranque y guarda la traza de Chrome al salir")
+    parser.add_argument("--grabar", metavar="FICHERO", help="graba la sesion en un diario repetible con sesion.py")
+    parser.add_argument("--semilla", type=int, help="semilla del ruido de encoders y de la flota")
+    parser.add_argument("--espejo", metavar="DIRECCION",
+                        help="muestra los robots de un servidor de poses (host:puerto o socket Unix)")
+    parser.add_argument("--sin-limites", action="store_true", help="deja que el robot salga del area inicial de 5 x 5 m")
+    args = parser.parse_args()
+
     app = QtWidgets.QApplication([])
-    main_window = MainWindow()
+    main_window = MainWindow(args.telemetria, None if args.sin_limites else TAMANO_MUNDO, args.perfil, args.grabar,
+                             args.semilla)
     main_window.resize(800, 600)
     main_window.show()
+    if args.log:
+        main_window.reproducir(args.log)
+    if args.mision:
+        main_window.ejecutar_mision(args.mision)
+    if args.espejo:
+        main_window.espejar(args.espejo)
     sys.exit(app.exec())
@@ -0,0 +1,153 @@
+import json
+
+import numpy as np
+
+TAMANO_CELDA = 50.0  # cm
+
+
+def _cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+
+def segments_intersect(a, b):
+    """Intersección (incluido el contacto) entre pares de segmentos (..., 4) x1, y1, x2, y2."""
+    ax1, ay1, ax2, ay2 = np.moveaxis(a, -1, 0)
+    bx1, by1, bx2, by2 = np.moveaxis(b, -1, 0)
+    o1 = _cross(ax2 - ax1, ay2 - ay1, bx1 - ax1, by1 - ay1)
+    o2 = _cross(ax2 - ax1, ay2 - ay1, bx2 - ax1, by2 - ay1)
+    o3 = _cross(bx2 - bx1, by2 - by1, ax1 - bx1, ay1 - by1)
+    o4 = _cross(bx2 - bx1, by2 - by1, ax2 - bx1, ay2 - by1)
+    crossing = (o1 * o2 <= 0) & (o3 * o4 <= 0)
+    # Segmentos colineales: solo se cortan si sus cajas se solapan
+    collinear = (o1 == 0) & (o2 == 0)
+    overlap = ((np.minimum(ax1, ax2) <= np.maximum(bx1, bx2)) & (np.minimum(bx1, bx2) <= np.maximum(ax1, ax2))
+               & (np.minimum(ay1, ay2) <= np.maximum(by1, by2)) & (np.minimum(by1, by2) <= np.maximum(ay1, ay2)))
+    return np.where(collinear, overlap, crossing)
+
+
+def points_in_triangles(px, py, triangles):
+    """Si cada punto (px, py) cae dentro del triángulo (..., 3, 2) correspondiente."""
+    signs = []
+    for i in range(3):
+        x1, y1 = triangles[..., i, 0], triangles[..., i, 1]
+        x2, y2 = triangles[..., (i + 1) % 3, 0], triangles[..., (i + 1) % 3, 1]
+        signs.append(_cross(x2 - x1, y2 - y1, px - x1, py - y1))
+    signs = np.array(signs)
+    return (signs >= 0).all(axis=0) | (signs <= 0).all(axis=0)
+
+
+class ObstacleMap:
+    """Obstáculos como segmentos con un índice de rejilla uniforme.
+
+    Cada celda guarda los segmentos cuya caja la toca (en formato CSR:
+    _cell_start y _cell_ids), así que una consulta solo mira los segmentos
+    de las celdas que cubre y su coste no depende del tamaño del mapa.
+    """
+
+    def __init__(self, segments, cell_size=TAMANO_CELDA):
+        self.segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        self.cell_size = cell_size
+        if len(self.segments):
+            xs = self.segments[:, [0, 2]]
+            ys = self.segments[:, [1, 3]]
+            self.origin = np.array([xs.min(), ys.min()])
+            self.cols = int((xs.max() - self.origin[0]) // cell_size) + 1
+            self.rows = int((ys.max() - self.origin[1]) // cell_size) + 1
+        else:
+            self.origin = np.zeros(2)
+            self.cols = self.rows = 1
+
+        x0, y0, x1, y1 = self._cell_ranges(
+            np.minimum(self.segments[:, 0], self.segments[:, 2]), np.minimum(self.segments[:, 1], self.segments[:, 3]),
+            np.maximum(self.segments[:, 0], self.segments[:, 2]), np.maximum(self.segments[:, 1], self.segments[:, 3]))
+        owners, cells = self._expand(x0, y0, x1, y1)
+        order = np.argsort(cells, kind="stable")
+        self._cell_ids = owners[order]
+        self._cell_start = np.searchsorted(cells[order], np.arange(self.rows * self.cols + 1))
+
+    @classmethod
+    def from_shapes(cls, segments=(), polygons=(), cell_size=TAMANO_CELDA):
+        """Mapa a partir de segmentos sueltos y polígonos cerrados (listas de vértices)."""
+        parts = [np.asarray(segments, dtype=np.float64).reshape(-1, 4)]
+        for polygon in polygons:
+            vertices = np.asarray(polygon, dtype=np.float64)
+            parts.append(np.hstack((vertices, np.roll(vertices, -1, axis=0))))
+        return cls(np.vstack(parts), cell_size)
+
+    @classmethod
+    def load(cls, path, cell_size=TAMANO_CELDA):
+        """Carga un plano JSON con las claves "segmentos" y/o "poligonos"."""
+        with open(path) as f:
+            data = json.load(f)
+        return cls.from_shapes(data.get("segmentos", ()), data.get("poligonos", ()), cell_size)
+
+    def __len__(self):
+        return len(self.segments)
+
+    def _cell_ranges(self, xmin, ymin, xmax, ymax):
+        to_cell = lambda v, o, n: np.clip(np.floor((v - o) / self.cell_size), -1, n).astype(np.intp)  # noqa: E731
+        x0, x1 = to_cell(xmin, self.origin[0], self.cols), to_cell(xmax, self.origin[0], self.cols)
+        y0, y1 = to_cell(ymin, self.origin[1], self.rows), to_cell(ymax, self.origin[1], self.rows)
+        # Las cajas que quedan fuera de la rejilla no cubren ninguna celda
+        empty = (x1 < 0) | (y1 < 0) | (x0 >= self.cols) | (y0 >= self.rows)
+        x0, y0 = np.maximum(x0, 0), np.maximum(y0, 0)
+        x1, y1 = np.minimum(x1, self.cols - 1), np.minimum(y1, self.rows - 1)
+        x1 = np.where(empty, x0 - 1, x1)
+        return x0, y0, x1, y1
+
+    @staticmethod
+    def _expand_ranges(counts):
+        owners = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return owners, local
+
+    def _expand(self, x0, y0, x1, y1):
+        """Pares (índice de la caja, celda) para todas las celdas de cada caja."""
+        width = np.maximum(x1 - x0 + 1, 0)
+        height = np.maximum(y1 - y0 + 1, 0)
+        owners, local = self._expand_ranges(width * height)
+        cells = (y0[owners] + local // width[owners]) * self.cols + x0[owners] + local % width[owners]
+        return owners, cells
+
+    def candidates(self, xmin, ymin, xmax, ymax):
+        """Pares (índice de consulta, segmento) de los segmentos cercanos a cada caja."""
+        owners, cells = self._expand(*self._cell_ranges(np.atleast_1d(xmin), np.atleast_1d(ymin),
+                                                        np.atleast_1d(xmax), np.atleast_1d(ymax)))
+        starts = self._cell_start[cells]
+        counts = self._cell_start[cells + 1] - starts
+        pair_owner, local = self._expand_ranges(counts)
+        return owners[pair_owner], self._cell_ids[starts[pair_owner] + local]
+
+    def collides_batch(self, old_footprints, new_footprints):
+        """Para cada robot, si su huella (N, 3, 2) choca al pasar de la pose vieja a la nueva.
+
+        Se comprueban los lados de la huella final, el recorrido de cada
+        vértice y los extremos de obstáculo que queden dentro de la huella final.
+        """
+        old_footprints = np.asarray(old_footprints, dtype=np.float64).reshape(-1, 3, 2)
+        new_footprints = np.asarray(new_footprints, dtype=np.float64).reshape(-1, 3, 2)
+        hit = np.zeros(len(new_footprints), dtype=bool)
+        if not len(self.segments):
+            return hit
+
+        both = np.concatenate((old_footprints, new_footprints), axis=1)
+        robots, segment_ids = self.candidates(both[..., 0].min(1), both[..., 1].min(1),
+                                              both[..., 0].max(1), both[..., 1].max(1))
+        if not len(robots):
+            return hit
+
+        new = new_footprints[robots]
+        old = old_footprints[robots]
+        queries = np.concatenate((
+            np.concatenate((new, np.roll(new, -1, axis=1)), axis=2),  # lados de la huella final
+            np.concatenate((old, new), axis=2),  # recorrido de cada vértice
+        ), axis=1)
+        obstacles = self.segments[segment_ids]
+        touched = segments_intersect(queries, obstacles[:, np.newaxis, :]).any(axis=1)
+        touched |= points_in_triangles(obstacles[:, 0], obstacles[:, 1], new)
+        touched |= points_in_triangles(obstacles[:, 2], obstacles[:, 3], new)
+        hit[robots[touched]] = True
+        return hit
+
+    def collides(self, old_footprint, new_footprint):
+        return bool(self.collides_batch(old_footprint, new_footprint)[0])
@@ -0,0 +1,296 @@
+import argparse
+import math
+import re
+import sys
+
+import numpy as np
+
+from odometria import METODOS_INTEGRACION, PULSO_CM_L, PULSO_CM_R, SEPARACION_RUEDAS, integrate_ticks
+from reproduccion import write_log
+
+VELOCIDAD_MISION = 10  # ticks por paso de la rueda más rápida
+FRECUENCIA_MISION = 1000  # Hz con que se fechan los pasos al guardar una misión como log
+
+# Las teclas del simulador son comandos predefinidos: una ráfaga de ticks por paso
+COMANDOS_PREDEFINIDOS = {
+    "adelante": "tick 10 10",
+    "atras": "tick -10 -10",
+    "gira_izquierda": "tick 10 -10",
+    "gira_derecha": "tick -10 10",
+    "curva_izquierda": "tick 10 7",
+    "curva_derecha": "tick 7 10",
+    "error": "tick 10 10 error",
+}
+
+_TOKEN = re.compile(r"""
+    (?P<comentario>\#[^\n]*)
+  | (?P<separador>[\n;,])
+  | (?P<numero>(?:r=)?[-+]?(?:\d+\.?\d*|\.\d+))[ \t]*(?P<unidad>cm\b|m\b|deg\b|rad\b|°)?
+  | (?P<llave>[{}])
+  | (?P<nombre>[A-Za-z_]\w*)
+  | (?P<espacio>[ \t\r]+)
+  | (?P<otro>.)
+""", re.VERBOSE)
+
+
+class Mission:
+    """Misión compilada: ticks (izquierda, derecha) y marca de error simulado para cada paso."""
+
+    def __init__(self, left=(), right=(), error=()):
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.error = np.asarray(error, dtype=bool)
+
+    def __len__(self):
+        return len(self.left)
+
+    @classmethod
+    def concatenate(cls, missions):
+        missions = list(missions)
+        if not missions:
+            return cls()
+        return cls(np.concatenate([m.left for m in missions]), np.concatenate([m.right for m in missions]),
+                   np.concatenate([m.error for m in missions]))
+
+    def repeat(self, n):
+        return Mission(np.tile(self.left, n), np.tile(self.right, n), np.tile(self.error, n))
+
+    def run(self, pose=(0.0, 0.0, 0.0, 0.0), method="euler", simulate_error=True):
+        """Integra toda la misión de una pasada; devuelve (x, y, theta, distancia) por paso.
+
+        Con simulate_error=False se ignoran las marcas de error y se obtiene la trayectoria real.
+        """
+        return integrate_ticks(self.left, self.right, *pose, simulate_error=self.error if simulate_error else None,
+                               method=method)
+
+    def save(self, path, rate=FRECUENCIA_MISION):
+        """Guarda la misión como log de encoders (sin las marcas de error) para reproducirla."""
+        write_log(path, np.arange(len(self)) / rate, self.left, self.right)
+
+
+def _spread(total_left, total_right, speed, error=False):
+    """Reparte los ticks de cada rueda en pasos de como mucho `speed` ticks, sin perder ninguno."""
+    steps = max(1, math.ceil(max(abs(total_left), abs(total_right)) / speed))
+    edges = np.arange(steps + 1) / steps
+    left = np.diff(np.round(total_left * edges)).astype(np.int32)
+    right = np.diff(np.round(total_right * edges)).astype(np.int32)
+    return Mission(left, right, np.full(steps, error))
+
+
+class _Compiler:
+    def __init__(self, source, commands, pulso_cm_l, pulso_cm_r, separacion):
+        self.tokens = []
+        line = 1
+        for match in _TOKEN.finditer(source):
+            kind = match.lastgroup if match.lastgroup != "unidad" else "numero"
+            if kind == "otro":
+                raise ValueError(f"Línea {line}: carácter inesperado {match.group()!r}")
+            if kind not in ("comentario", "espacio"):
+                self.tokens.append((kind, match, line))
+            line += match.group().count("\n")
+        self.position = 0
+        self.commands = dict(commands)
+        self.pulso_cm_l = pulso_cm_l
+        self.pulso_cm_r = pulso_cm_r
+        self.separacion = separacion
+        self.speed = VELOCIDAD_MISION
+        self.expanding = []
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None, self._line())
+
+    def _line(self):
+        return self.tokens[-1][2] if self.tokens else 1
+
+    def _next(self, kind, what):
+        token_kind, match, line = self._peek()
+        if token_kind != kind:
+            found = match.group().strip() if match else "el final"
+            raise ValueError(f"Línea {line}: se esperaba {what} y hay {found!r}")
+        self.position += 1
+        return match, line
+
+    def _number(self, what, units=(None,)):
+        match, line = self._next("numero", what)
+        unit = match.group("unidad")
+        if unit not in units:
+            raise ValueError(f"Línea {line}: unidad {unit!r} no válida para {what}")
+        return float(match.group("numero").removeprefix("r=")), unit
+
+    def _integer(self, what, negative=False):
+        line = self._peek()[2]
+        value, _ = self._number(what)
+        if value != int(value) or (value < 0 and not negative):
+            kind = "un entero" if negative else "un entero no negativo"
+            raise ValueError(f"Línea {line}: se esperaba {kind} para {what} y hay {value:g}")
+        return int(value)
+
+    def _distance(self):
+        value, unit = self._number("una distancia", (None, "cm", "m"))
+        return value * 100 if unit == "m" else value
+
+    def _angle(self):
+        value, unit = self._number("un ángulo", (None, "deg", "°", "rad"))
+        return value if unit == "rad" else math.radians(value)
+
+    def _wheels(self, left_cm, right_cm, error=False):
+        return _spread(round(left_cm / self.pulso_cm_l), round(right_cm / self.pulso_cm_r), self.speed, error)
+
+    def block(self, closing=False):
+        parts = []
+        while True:
+            kind, match, line = self._peek()
+            if kind is None:
+                if closing:
+                    raise ValueError(f"Línea {line}: falta cerrar un bloque con '}}'")
+                return Mission.concatenate(parts)
+            if kind == "separador":
+                self.position += 1
+            elif kind == "llave" and match.group() == "}":
+                if not closing:
+                    raise ValueError(f"Línea {line}: '}}' sin bloque abierto")
+                self.position += 1
+                return Mission.concatenate(parts)
+            elif self._repeats_block():
+                # "repeat N" sin nada detrás repite lo anterior del bloque
+                self.position += 1
+                parts = [Mission.concatenate(parts).repeat(self._integer("el número de repeticiones"))]
+            else:
+                mission = self.statement()
+                if mission is not None:
+                    parts.append(mission)
+
+    def _repeats_block(self):
+        if self.position + 2 > len(self.tokens):
+            return False
+        (kind, match, _), (count, _, _) = self.tokens[self.position:self.position + 2]
+        if kind != "nombre" or match.group() != "repeat" or count != "numero":
+            return False
+        after = self.tokens[self.position + 2] if self.position + 2 < len(self.tokens) else None
+        return after is None or after[0] == "separador" or (after[0] == "llave" and after[1].group() == "}")
+
+    def _body(self):
+        match, _ = self._next("llave", "'{'")
+        if match.group() != "{":
+            raise ValueError(f"Línea {self._peek()[2]}: se esperaba '{{'")
+        return self.block(closing=True)
+
+    def statement(self):
+        match, line = self._next("nombre", "un comando")
+        word = match.group()
+        half = self.separacion / 2
+        if word in ("forward", "backward"):
+            distance = self._distance() * (1 if word == "forward" else -1)
+            return self._wheels(distance, distance)
+        if word == "rotate":
+            # Ángulo positivo: theta crece, como en step_pose
+            angle = self._angle()
+            return self._wheels(-angle * half, angle * half)
+        if word == "arc":
+            radius = self._distance()
+            angle = self._angle()
+            if radius < 0:
+                raise ValueError(f"Línea {line}: el radio del arco no puede ser negativo")
+            # El sentido del giro lo da el signo del ángulo; el robot siempre avanza
+            turn = abs(angle)
+            inner, outer = (radius - half) * turn, (radius + half) * turn
+            return self._wheels(inner, outer) if angle >= 0 else self._wheels(outer, inner)
+        if word == "tick":
+            left = self._integer("los ticks de la rueda izquierda", negative=True)
+            right = self._integer("los ticks de la rueda derecha", negative=True)
+            count = 1
+            if self._peek()[0] == "numero":
+                count = self._integer("el número de pasos")
+            error = self._peek()[0] == "nombre" and self._peek()[1].group() == "error"
+            if error:
+                self.position += 1
+            return Mission(np.full(count, left), np.full(count, right), np.full(count, error))
+        if word == "speed":
+            speed, _ = self._number("una velocidad en ticks por paso")
+            if speed <= 0:
+                raise ValueError(f"Línea {line}: la velocidad debe ser positiva")
+            self.speed = speed
+            return None
+        if word == "repeat":
+            count = self._integer("el número de repeticiones")
+            # El cuerpo se compila una vez y se replica con np.tile; sin llaves se repite solo el comando siguiente
+            kind, brace, _ = self._peek()
+            body = self._body() if kind == "llave" and brace.group() == "{" else self.statement()
+            return (body or Mission()).repeat(count)
+        if word == "define":
+            name, _ = self._next("nombre", "el nombre del comando")
+            # El cuerpo se guarda sin compilar; se compila en cada uso con la velocidad de ese momento
+            brace, _ = self._next("llave", "'{'")
+            if brace.group() != "{":
+                raise ValueError(f"Línea {line}: se esperaba '{{'")
+            start = self.position
+            depth = 1
+            while depth:
+                kind, brace, _ = self._peek()
+                if kind is None:
+                    raise ValueError(f"Línea {line}: falta cerrar el bloque de {name.group()!r} con '}}'")
+                if kind == "llave":
+                    depth += 1 if brace.group() == "{" else -1
+                self.position += 1
+            self.commands[name.group()] = self.tokens[start:self.position - 1]
+            return None
+        if word in self.commands:
+            if word in self.expanding:
+                raise ValueError(f"Línea {line}: el comando {word!r} se usa a sí mismo")
+            body = self.commands[word]
+            if isinstance(body, str):
+                body = _Compiler(body, {}, self.pulso_cm_l, self.pulso_cm_r, self.separacion).tokens
+                self.commands[word] = body
+            # Se compila el cuerpo en su sitio, como si estuviera escrito aquí
+            saved = self.tokens, self.position
+            self.tokens, self.position = list(body), 0
+            self.expanding.append(word)
+            try:
+                mission = self.block()
+            finally:
+                self.expanding.pop()
+                self.tokens, self.position = saved
+            return mission
+        raise ValueError(f"Línea {line}: comando desconocido {word!r}")
+
+
+def compile_mission(source, commands=COMANDOS_PREDEFINIDOS, pulso_cm_l=PULSO_CM_L, pulso_cm_r=PULSO_CM_R,
+                    separacion=SEPARACION_RUEDAS):
+    """Compila el texto de una misión a una Mission con los ticks de cada paso.
+
+    Comandos (separados por líneas, ';' o ','; '#' inicia un comentario):
+      forward D / backward D   avanza o retrocede D cm (admite "cm" y "m")
+      rotate A                 gira A grados sobre sí mismo (admite "°", "deg" y "rad")
+      arc R A                  avanza por un arco de radio R cm girando A grados ("arc r=50 90°")
+      tick L R [N] [error]     N pasos con L y R ticks, con el error simulado de la tecla P
+      speed V                  ticks por paso de la rueda más rápida en los comandos siguientes
+      repeat N { ... }         repite el bloque N veces ("repeat N comando" repite solo ese comando
+                               y un "repeat N" suelto, todo lo anterior del bloque)
+      define nombre { ... }    define un comando nuevo
+    Los nombres de `commands` (por defecto, los de las teclas) se pueden usar como comandos.
+    """
+    compiler = _Compiler(source, commands, pulso_cm_l, pulso_cm_r, separacion)
+    return compiler.block()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compila una misión a un log de encoders y la integra")
+    parser.add_argument("mision", help="fichero con el texto de la misión")
+    parser.add_argument("--salida", help="log .odolog donde guardar los ticks compilados")
+    parser.add_argument("--frecuencia", type=float, default=FRECUENCIA_MISION, help="pasos por segundo del log")
+    parser.add_argument("--metodo", choices=METODOS_INTEGRACION, default="euler")
+    args = parser.parse_args(argv)
+
+    with open(args.mision) as f:
+        mission = compile_mission(f.read())
+    x, y, theta, distancia = mission.run(method=args.metodo)
+    print(f"{len(mission)} pasos, {distancia[-1] if len(mission) else 0.0:.2f} cm recorridos")
+    if len(mission):
+        print(f"Pose final: x={x[-1]:.3f} cm, y={y[-1]:.3f} cm, theta={math.degrees(theta[-1]) % 360:.3f}°")
+    if args.salida:
+        mission.save(args.salida, args.frecuencia)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
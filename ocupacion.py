@@ -0,0 +1,180 @@
+import math
+
+import numpy as np
+
+from odometria import TAMANO_ROBOT
+
+CELDA_COBERTURA = 2.5  # cm
+RADIO_COBERTURA = TAMANO_ROBOT / 2  # cm; ancho de la franja que barre el robot
+MAX_PASADAS = 255  # las cuentas se saturan en uint8
+
+# Movimientos entre celdas vecinas: (fila, columna)
+_DIRECCIONES = np.array([(0, 1), (0, -1), (1, 0), (-1, 0)])
+
+
+def _traverse(x0, y0, x1, y1, cell):
+    """Celdas (fila, columna, dirección) por las que entra el segmento, en orden (Amanatides-Woo).
+
+    Es una supercover con pasos de una celda en horizontal o en vertical:
+    al cruzar justo por una esquina se pasa por una de las celdas laterales.
+    """
+    c, r = math.floor(x0 / cell), math.floor(y0 / cell)
+    c1, r1 = math.floor(x1 / cell), math.floor(y1 / cell)
+    dx, dy = x1 - x0, y1 - y0
+    step_c = 1 if dx > 0 else -1
+    step_r = 1 if dy > 0 else -1
+    t_max_c = ((c + (step_c > 0)) * cell - x0) / dx if dx else math.inf
+    t_max_r = ((r + (step_r > 0)) * cell - y0) / dy if dy else math.inf
+    t_delta_c = cell / abs(dx) if dx else math.inf
+    t_delta_r = cell / abs(dy) if dy else math.inf
+    moves = []
+    for _ in range(abs(c1 - c) + abs(r1 - r)):
+        # Con redondeos, el eje que ya llegó a su celda final no vuelve a avanzar
+        if r == r1 or (c != c1 and t_max_c < t_max_r):
+            c += step_c
+            t_max_c += t_delta_c
+            moves.append((r, c, 0 if step_c > 0 else 1))
+        else:
+            r += step_r
+            t_max_r += t_delta_r
+            moves.append((r, c, 2 if step_r > 0 else 3))
+    return moves
+
+
+class CoverageGrid:
+    """Rejilla de cobertura: cuántas veces ha pasado el robot por cada celda del mundo.
+
+    El robot cubre un disco de `radius` cm alrededor de su centro. Cada vez
+    que el centro cambia de celda se recorre el segmento con una supercover
+    y, por cada paso a una celda vecina, solo se suman las celdas del borde
+    delantero del disco (precalculado para las cuatro direcciones), así que
+    una celda cuenta una pasada cada vez que el robot entra en ella y el
+    coste de cada paso es proporcional a las celdas que toca, no al tamaño
+    de la rejilla. covered, overlapped y revisits se mantienen al día sobre
+    la marcha. dirty acumula la caja (fila0, col0, fila1, col1) de las celdas
+    cambiadas para que la capa que la pinta solo rehaga esa zona.
+    """
+
+    def __init__(self, width, height, cell=CELDA_COBERTURA, radius=RADIO_COBERTURA):
+        self.width = width
+        self.height = height
+        self.cell = cell
+        self.rows = math.ceil(height / cell)
+        self.cols = math.ceil(width / cell)
+        self.counts = np.zeros((self.rows, self.cols), dtype=np.uint8)
+
+        reach = int(radius / cell)
+        dr, dc = np.mgrid[-reach:reach + 1, -reach:reach + 1]
+        inside = dr ** 2 + dc ** 2 <= (radius / cell) ** 2
+        self._disk = np.column_stack((dr[inside], dc[inside]))
+        # Borde delantero: celdas del disco en la celda nueva que no estaban en el de la anterior
+        disk = set(map(tuple, self._disk.tolist()))
+        self._edges = np.array([[o for o in self._disk.tolist() if (o[0] + d[0], o[1] + d[1]) not in disk]
+                                for d in _DIRECCIONES.tolist()])
+        self.generation = -1
+        self.clear()
+
+    def clear(self):
+        self.counts.fill(0)
+        self.covered = 0  # celdas con al menos una pasada
+        self.overlapped = 0  # celdas con dos o más
+        self.revisits = 0  # entradas en celdas ya cubiertas
+        self.version = 0
+        self.generation += 1
+        self.dirty = (0, 0, self.rows, self.cols)
+        self._position = None
+        self._cell = None
+
+    @property
+    def coverage(self):
+        """Fracción de las celdas de la rejilla cubiertas al menos una vez."""
+        return self.covered / self.counts.size
+
+    @property
+    def overlap(self):
+        """Fracción de las celdas cubiertas por las que se ha pasado más de una vez."""
+        return self.overlapped / self.covered if self.covered else 0.0
+
+    def _cell_of(self, x, y):
+        return math.floor(y / self.cell), math.floor(x / self.cell)
+
+    def _mark(self, rows, cols, distinct=False):
+        rows, cols = rows.ravel(), cols.ravel()
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        if not inside.any():
+            return
+        rows, cols = rows[inside], cols[inside]
+        if distinct:
+            # Un solo disco o un solo borde: ninguna celda se repite
+            cells = rows * self.cols + cols
+            entries = np.ones(len(cells), dtype=np.intp)
+        else:
+            cells, entries = np.unique(rows * self.cols + cols, return_counts=True)
+        flat = self.counts.reshape(-1)
+        old = flat[cells].astype(np.intp)
+        new = old + entries
+        first = old == 0
+        self.covered += int(first.sum())
+        self.overlapped += int(((old < 2) & (new >= 2)).sum())
+        self.revisits += int(entries.sum() - first.sum())
+        flat[cells] = np.minimum(new, MAX_PASADAS)
+        self.version += 1
+        box = (int(rows.min()), int(cols.min()), int(rows.max()) + 1, int(cols.max()) + 1)
+        if self.dirty is not None:
+            box = (min(box[0], self.dirty[0]), min(box[1], self.dirty[1]),
+                   max(box[2], self.dirty[2]), max(box[3], self.dirty[3]))
+        self.dirty = box
+
+    def _enter(self, rows, cols, directions):
+        edges = self._edges[directions]
+        self._mark(np.asarray(rows)[:, np.newaxis] + edges[..., 0], np.asarray(cols)[:, np.newaxis] + edges[..., 1],
+                   distinct=len(edges) == 1)
+
+    def start(self, x, y):
+        """Vacía la rejilla y marca el disco del robot en (x, y)."""
+        self.clear()
+        self._position = (x, y)
+        self._cell = self._cell_of(x, y)
+        self._mark(self._cell[0] + self._disk[:, 0], self._cell[1] + self._disk[:, 1], distinct=True)
+
+    def move_to(self, x, y):
+        if self._position is None:
+            self.start(x, y)
+            return
+        cell = self._cell_of(x, y)
+        if cell != self._cell:
+            moves = _traverse(*self._position, x, y, self.cell)
+            rows, cols, directions = zip(*moves)
+            self._enter(rows, cols, list(directions))
+            self._cell = cell
+        self._position = (x, y)
+
+    def extend(self, xs, ys):
+        """move_to() de muchas poses de una vez, con las entradas de todas sumadas juntas."""
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if not len(xs):
+            return
+        if self._position is None:
+            self.start(xs[0], ys[0])
+        px = np.concatenate(([self._position[0]], xs))
+        py = np.concatenate(([self._position[1]], ys))
+        rows = np.floor(py / self.cell).astype(np.intp)
+        cols = np.floor(px / self.cell).astype(np.intp)
+        dr, dc = np.diff(rows), np.diff(cols)
+        steps = np.abs(dr) + np.abs(dc)
+        # Los saltos a una celda vecina, que son casi todos, van vectorizados
+        near = np.flatnonzero(steps == 1) + 1
+        directions = np.select([dc[near - 1] == 1, dc[near - 1] == -1, dr[near - 1] == 1], [0, 1, 2], 3)
+        targets = [(rows[near], cols[near], directions)]
+        for i in np.flatnonzero(steps > 1) + 1:
+            far = np.array(_traverse(px[i - 1], py[i - 1], px[i], py[i], self.cell)).T
+            targets.append((far[0], far[1], far[2]))
+        self._enter(*(np.concatenate(parts) for parts in zip(*targets)))
+        self._position = (float(xs[-1]), float(ys[-1]))
+        self._cell = (int(rows[-1]), int(cols[-1]))
+
+    def take_dirty(self):
+        """Caja de celdas cambiadas desde la última llamada, o None."""
+        dirty, self.dirty = self.dirty, None
+        return dirty
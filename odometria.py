@@ -0,0 +1,153 @@
+import math
+
+import numpy as np
+
+# Características físicas del robot
+DIAMETRO_RUEDA_L = 6.5  # cm
+DIAMETRO_RUEDA_R = 6.5  # cm
+SEPARACION_RUEDAS = 13.0  # cm
+RESOLUCION_ENCODER = 360  # pulsos por vuelta
+PULSO_CM_L = (math.pi * DIAMETRO_RUEDA_L) / RESOLUCION_ENCODER
+PULSO_CM_R = (math.pi * DIAMETRO_RUEDA_R) / RESOLUCION_ENCODER
+
+FACTOR_ERROR_R = 0.7  # deslizamiento de la rueda derecha al simular error
+
+TAMANO_ROBOT = 15  # mismo triángulo que dibuja SimulationWidget
+
+# Esquemas de integración de cada paso:
+#   - "euler": avanza con el rumbo final del paso (el modelo original).
+#   - "midpoint": avanza con el rumbo medio del paso (Runge-Kutta de 2º orden).
+#   - "arc": solución exacta si las ruedas giran a velocidad constante en el
+#     paso; es el punto medio con la cuerda del arco, dc * sin(h) / h, h = dtheta / 2.
+METODOS_INTEGRACION = ("euler", "midpoint", "arc")
+
+
+def check_method(method):
+    """Lanza ValueError si method no es uno de METODOS_INTEGRACION."""
+    if method not in METODOS_INTEGRACION:
+        raise ValueError(f"Método de integración desconocido: {method}")
+
+
+def step_pose(x, y, theta, left_ticks, right_ticks, simulate_error=False,
+              pulso_cm_l=PULSO_CM_L, pulso_cm_r=PULSO_CM_R, separacion=SEPARACION_RUEDAS, method="euler"):
+    """Avanza una pose (theta en radianes) con un par de lecturas de encoder.
+
+    Devuelve (x, y, theta, recorrido) donde recorrido es la distancia
+    comandada, sin el error simulado.
+    """
+    dl = left_ticks * pulso_cm_l
+    dr = right_ticks * pulso_cm_r
+    recorrido = abs((dl + dr) / 2.0)
+
+    if simulate_error:
+        dr *= FACTOR_ERROR_R
+
+    dc = (dl + dr) / 2.0
+    dtheta = (dr - dl) / separacion
+
+    new_theta = theta + dtheta
+    if method == "euler":
+        heading = new_theta
+    else:
+        check_method(method)
+        half = dtheta / 2.0
+        heading = theta + half
+        if method == "arc" and half:
+            dc *= math.sin(half) / half
+    return x + dc * math.cos(heading), y + dc * math.sin(heading), new_theta, recorrido
+
+
+def footprint(x, y, theta, size=TAMANO_ROBOT):
+    """Vértices (..., 3, 2) del triángulo del robot en cada pose."""
+    shape = np.array([[size, 0.0], [-size / 2, -size / 2], [-size / 2, size / 2]])
+    x, y, theta = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (x, y, theta)))
+    cos = np.cos(theta)[..., np.newaxis]
+    sin = np.sin(theta)[..., np.newaxis]
+    vertices = np.empty(x.shape + (3, 2))
+    vertices[..., 0] = x[..., np.newaxis] + shape[:, 0] * cos - shape[:, 1] * sin
+    vertices[..., 1] = y[..., np.newaxis] + shape[:, 0] * sin + shape[:, 1] * cos
+    return vertices
+
+
+def inside_world(x, y, world_size):
+    """Si (x, y) queda estrictamente dentro del mundo world_size = (ancho, alto).
+
+    Con arrays devuelve la máscara elemento a elemento; sin world_size no
+    hay bordes y todo queda dentro.
+    """
+    if world_size is None:
+        return np.ones(np.shape(x), dtype=bool)
+    width, height = world_size
+    return (0 < x) & (x < width) & (0 < y) & (y < height)
+
+
+def step_tracks(true_pose, estimated_pose, left_ticks, right_ticks, simulate_error=False, method="euler",
+                world_size=None, obstacle_map=None, read_encoders=None):
+    """Avanza un paso la pose real y la estimada de un robot, cada una (x, y, ángulo en grados).
+
+    La pose real sigue exactamente los ticks ordenados y es la que choca
+    con los bordes de world_size y con obstacle_map; si chocaría no se
+    mueve ninguna de las dos y devuelve None. Si no, la estimada integra
+    lo que devuelva read_encoders(left_ticks, right_ticks), o los mismos
+    ticks, con la rueda derecha corrupta si simulate_error.
+
+    Devuelve (real, estimada, recorrido): las poses nuevas como
+    (x, y, ángulo en grados, theta en radianes sin normalizar) y la
+    distancia comandada del paso.
+    """
+    true_x, true_y, true_angle = true_pose
+    true_theta = math.radians(true_angle)
+    x, y, theta, recorrido = step_pose(true_x, true_y, true_theta, left_ticks, right_ticks, method=method)
+    if world_size is not None and not inside_world(x, y, world_size):
+        return None
+    if obstacle_map is not None and obstacle_map.collides(footprint(true_x, true_y, true_theta),
+                                                          footprint(x, y, theta)):
+        return None
+
+    if read_encoders is not None:
+        left_ticks, right_ticks = read_encoders(left_ticks, right_ticks)
+    ex, ey, estimated_theta, _ = step_pose(estimated_pose[0], estimated_pose[1], math.radians(estimated_pose[2]),
+                                           left_ticks, right_ticks, simulate_error, method=method)
+    return ((x, y, math.degrees(theta) % 360, theta),
+            (ex, ey, math.degrees(estimated_theta) % 360, estimated_theta), recorrido)
+
+
+def integrate_ticks(left_ticks, right_ticks, x0=0.0, y0=0.0, theta0=0.0, distancia0=0.0,
+                    simulate_error=None, pulso_cm_l=PULSO_CM_L, pulso_cm_r=PULSO_CM_R,
+                    separacion=SEPARACION_RUEDAS, method="euler"):
+    """Integra de una vez una secuencia de lecturas de encoder.
+
+    Los ticks tienen forma (..., T); la pose inicial y los parámetros del
+    robot pueden ser escalares o arrays con las dimensiones iniciales (...),
+    lo que permite integrar varias trayectorias en una sola pasada.
+    Devuelve los arrays (x, y, theta, distancia) de forma (..., T) con la
+    pose tras cada paso, igual que encadenar llamadas a step_pose.
+    """
+    check_method(method)
+    left_ticks = np.asarray(left_ticks, dtype=np.float64)
+    right_ticks = np.asarray(right_ticks, dtype=np.float64)
+
+    def por_trayectoria(valor):
+        return np.asarray(valor, dtype=np.float64)[..., np.newaxis]
+
+    dl = left_ticks * por_trayectoria(pulso_cm_l)
+    dr = right_ticks * por_trayectoria(pulso_cm_r)
+    recorrido = np.abs((dl + dr) / 2.0)
+
+    if simulate_error is not None:
+        dr = np.where(simulate_error, dr * FACTOR_ERROR_R, dr)
+
+    dc = (dl + dr) / 2.0
+    dtheta = (dr - dl) / por_trayectoria(separacion)
+
+    theta = por_trayectoria(theta0) + np.cumsum(dtheta, axis=-1)
+    if method == "euler":
+        heading = theta
+    else:
+        heading = theta - dtheta / 2.0
+        if method == "arc":
+            dc = dc * np.sinc(dtheta / (2.0 * np.pi))
+    x = por_trayectoria(x0) + np.cumsum(dc * np.cos(heading), axis=-1)
+    y = por_trayectoria(y0) + np.cumsum(dc * np.sin(heading), axis=-1)
+    distancia = por_trayectoria(distancia0) + np.cumsum(recorrido, axis=-1)
+    return x, y, theta, distancia
@@ -0,0 +1,186 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BINS_HISTOGRAMA = 33  # bin b: duraciones de 2**(b-1) a 2**b ns, hasta ~4 s
+EVENTOS_TRAZA = 1 << 17  # eventos que se guardan para la traza (los más recientes)
+FRECUENCIA_FRAMES = 60  # Hz con que se mide si un frame llegó tarde
+UMBRAL_FRAME_PERDIDO = 1.5  # un intervalo mayor que 1.5 periodos cuenta como frame perdido
+
+
+def peak_rss_mb():
+    """Pico de memoria residente, o None donde no hay getrusage()."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KiB y macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb():
+    """Memoria residente actual; donde no hay /proc se usa el pico (o None)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULO = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, self.start, time.perf_counter_ns() - self.start)
+        return False
+
+
+class StageStats:
+    """Contador, total, máximo e histograma logarítmico (potencias de 2 en ns) de una etapa."""
+    __slots__ = ("count", "total_ns", "max_ns", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.histogram = [0] * BINS_HISTOGRAMA
+
+    def add(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.histogram[min(duration_ns.bit_length(), BINS_HISTOGRAMA - 1)] += 1
+
+    @property
+    def mean_ms(self):
+        return self.total_ns / self.count / 1e6 if self.count else 0.0
+
+    def percentile_ms(self, p):
+        """Cota superior del percentil p, con la resolución del histograma (factor 2)."""
+        target = p / 100 * self.count
+        seen = 0
+        for b, n in enumerate(self.histogram):
+            seen += n
+            if n and seen >= target:
+                return min(2 ** b, self.max_ns) / 1e6
+        return self.max_ns / 1e6
+
+
+class Profiler:
+    """Tiempos por etapa, estadísticas de frames y traza exportable a Chrome (chrome://tracing, Perfetto).
+
+    Se instrumenta con `with profiler.span("etapa"):`. Desactivado, span()
+    devuelve siempre el mismo contexto vacío, así que el coste es una
+    llamada a método; activado, cada tramo suma O(1) a su StageStats y
+    guarda un evento en un buffer circular de trace_events eventos.
+    """
+
+    def __init__(self, enabled=False, trace_events=EVENTOS_TRAZA, frame_hz=FRECUENCIA_FRAMES):
+        self.enabled = enabled
+        self.frame_hz = frame_hz
+        self._events = deque(maxlen=trace_events)
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+        self.frames = StageStats()  # intervalos entre frames
+        self.dropped_frames = 0
+        self._events.clear()
+        self._origin_ns = time.perf_counter_ns()
+        self._last_frame_ns = None
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NULO
+
+    def add(self, name, start_ns, duration_ns):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        stats.add(duration_ns)
+        self._events.append(("X", name, start_ns, duration_ns, threading.get_ident()))
+
+    def frame(self):
+        """Marca el inicio de un frame pintado."""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        if self._last_frame_ns is not None:
+            interval = now - self._last_frame_ns
+            self.frames.add(interval)
+            if interval > UMBRAL_FRAME_PERDIDO * 1e9 / self.frame_hz:
+                self.dropped_frames += max(1, round(interval * self.frame_hz / 1e9) - 1)
+        self._last_frame_ns = now
+
+    def counter(self, name, value):
+        """Muestra un valor (tamaño del rastro, memoria...) que también va a la traza."""
+        if not self.enabled:
+            return
+        self.counters[name] = value
+        self._events.append(("C", name, time.perf_counter_ns(), value, threading.get_ident()))
+
+    def summary(self):
+        stages = {name: {"n": s.count, "medio_ms": s.mean_ms, "p99_ms": s.percentile_ms(99), "max_ms": s.max_ns / 1e6}
+                  for name, s in self.stages.items()}
+        frame_ms = self.frames.mean_ms
+        return {
+            "etapas": stages,
+            "fps": 1000 / frame_ms if frame_ms else 0.0,
+            "frame_p99_ms": self.frames.percentile_ms(99),
+            "frames_perdidos": self.dropped_frames,
+            "contadores": dict(self.counters),
+        }
+
+    def report_lines(self):
+        """Resumen en líneas de texto para el overlay o la consola."""
+        summary = self.summary()
+        lines = [f"{summary['fps']:5.1f} FPS  p99 {summary['frame_p99_ms']:.1f} ms  "
+                 f"perdidos {summary['frames_perdidos']}"]
+        for name, s in sorted(summary["etapas"].items()):
+            lines.append(f"{name:12s} {s['medio_ms']:7.3f} ms  p99 {s['p99_ms']:7.3f}  max {s['max_ms']:7.3f}")
+        for name, value in summary["contadores"].items():
+            lines.append(f"{name:12s} {value:,.1f}" if isinstance(value, float) else f"{name:12s} {value:,}")
+        return lines
+
+    def export_chrome_trace(self, path):
+        """Escribe los eventos guardados en el formato JSON de trace events."""
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "simulador odometria"}}]
+        for kind, name, start_ns, value, tid in list(self._events):
+            event = {"name": name, "ph": kind, "ts": (start_ns - self._origin_ns) / 1000, "pid": pid, "tid": tid}
+            if kind == "X":
+                event["dur"] = value / 1000
+            else:
+                event["args"] = {name: value}
+            events.append(event)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,91 @@
+import numpy as np
+
+from odometria import integrate_ticks
+
+PASO_CHECKPOINT = 4096  # pasos entre checkpoints
+BLOQUE_CHECKPOINTS = 64  # checkpoints que se calculan por bloque al construir el índice
+
+
+class PoseCheckpoints:
+    """Índice de poses guardadas cada `every` pasos de una secuencia de ticks.
+
+    checkpoints[k] es (x, y, theta, distancia) tras k * every pasos, de modo
+    que pose_at(step) solo tiene que integrar como mucho every - 1 ticks
+    desde el checkpoint anterior, sea cual sea la longitud del log. left y
+    right pueden ser arrays en memoria o columnas de un memmap.
+
+    Con lazy=True no se integra nada al crearlo: build() añade checkpoints
+    por bloques cuando se le llama (p. ej. desde un timer de la interfaz) y
+    solo se puede ir a los pasos hasta `available`.
+    """
+
+    def __init__(self, left, right, every=PASO_CHECKPOINT, pose=(0.0, 0.0, 0.0, 0.0), method="euler", lazy=False):
+        self.left = left
+        self.right = right
+        self.every = every
+        self.method = method
+        n = len(left)
+        self.checkpoints = np.empty((n // every + 1, 4), dtype=np.float64)
+        self.checkpoints[0] = pose
+        self.built = 1  # checkpoints ya calculados
+        if not lazy:
+            self.build()
+
+    @classmethod
+    def from_log(cls, log, every=PASO_CHECKPOINT, pose=(0.0, 0.0, 0.0, 0.0), method="euler", lazy=False):
+        return cls(log.left, log.right, every, pose, method, lazy)
+
+    def __len__(self):
+        return len(self.left)
+
+    @property
+    def complete(self):
+        return self.built == len(self.checkpoints)
+
+    @property
+    def available(self):
+        """Último paso al que se puede ir con los checkpoints ya calculados."""
+        return len(self) if self.complete else self.built * self.every - 1
+
+    def build(self, chunks=None):
+        """Calcula los checkpoints que faltan, todos o solo `chunks` bloques; devuelve si están todos.
+
+        Los bloques son siempre los mismos, así que el resultado no depende
+        de cuántas llamadas hagan falta para completarlo.
+        """
+        last = (len(self.checkpoints) - 1) * self.every
+        chunk = self.every * BLOQUE_CHECKPOINTS
+        begin = (self.built - 1) * self.every
+        stop = last if chunks is None else min(last, begin + chunks * chunk)
+        x0, y0, theta0, d0 = self.checkpoints[self.built - 1]
+        for begin in range(begin, stop, chunk):
+            end = min(begin + chunk, stop)
+            x, y, theta, distancia = integrate_ticks(self.left[begin:end], self.right[begin:end], x0, y0, theta0,
+                                                     d0, method=self.method)
+            picks = np.arange(self.every - 1, end - begin, self.every)
+            first = begin // self.every + 1
+            self.checkpoints[first:first + len(picks)] = np.column_stack(
+                (x[picks], y[picks], theta[picks], distancia[picks]))
+            self.built = first + len(picks)
+            x0, y0, theta0, d0 = self.checkpoints[self.built - 1]
+        return self.complete
+
+    def pose_at(self, step):
+        """Pose (x, y, theta, distancia) tras los primeros `step` pasos."""
+        if not 0 <= step <= self.available:
+            raise IndexError(f"Paso {step} fuera del rango 0..{self.available}")
+        k = step // self.every
+        pose = self.checkpoints[k]
+        begin = k * self.every
+        if step == begin:
+            return tuple(float(v) for v in pose)
+        x, y, theta, distancia = integrate_ticks(self.left[begin:step], self.right[begin:step], *pose,
+                                                 method=self.method)
+        return float(x[-1]), float(y[-1]), float(theta[-1]), float(distancia[-1])
+
+    def trail_until(self, step):
+        """Rastro aproximado (xs, ys) hasta `step`: los checkpoints previos y la pose final."""
+        k = step // self.every
+        x, y, _, _ = self.pose_at(step)
+        return (np.append(self.checkpoints[:k + 1, 0], x),
+                np.append(self.checkpoints[:k + 1, 1], y))
@@ -0,0 +1,320 @@
+import numpy as np
+
+CAPACIDAD_RASTRO = 1 << 20  # puntos
+PASO_NIVEL = 4  # cada nivel de la pirámide guarda uno de cada 4 puntos del anterior
+NIVELES = 6  # pasos 1, 4, ..., 1024
+PUNTOS_BLOQUE = 1024  # puntos del nivel 0 que cubre cada caja
+PUNTOS_VISIBLES = 1 << 15  # puntos como mucho que devuelve una consulta
+TRAMO_DIEZMADO = 16  # puntos del primer tramo vectorizado tras cada punto nuevo al diezmar en bloque
+
+
+def _decimate(mode, tolerance, previous, last, x, y):
+    """Qué hacer con (x, y) según los dos últimos puntos guardados: "nuevo", "descartar" o "sustituir"."""
+    if mode == "distancia" and last is not None:
+        lx, ly = last
+        if (x - lx) ** 2 + (y - ly) ** 2 < tolerance ** 2:
+            return "descartar"
+    elif mode == "colineal" and previous is not None:
+        ax, ay = previous
+        bx, by = last
+        ux, uy = x - ax, y - ay
+        norm2 = ux * ux + uy * uy
+        if norm2 > 0:
+            along = (bx - ax) * ux + (by - ay) * uy
+            cross = (bx - ax) * uy - (by - ay) * ux
+            if 0 <= along <= norm2 and cross * cross < tolerance ** 2 * norm2:
+                return "sustituir"
+    return "nuevo"
+
+
+def _decimate_batch(mode, tolerance, points):
+    """Índices de points que quedan guardados si se añaden uno a uno con _decimate().
+
+    points empieza por los puntos ya guardados que mira _decimate (el
+    penúltimo y el último en "colineal", el último en "distancia", o menos
+    si el rastro tiene menos). Mientras el ancla (el penúltimo guardado, o
+    el último en "distancia") no cambia, la decisión de cada punto no
+    depende de las anteriores, así que se evalúa en tramos vectorizados que
+    crecen al doble mientras ningún punto obliga a mover el ancla. Cuando
+    los tramos salen muy cortos (un rastro con mucho ruido) se sigue punto a
+    punto con _decimate hasta que vuelve a haber uno largo. Las operaciones
+    son las mismas y en el mismo orden que en _decimate, de modo que el
+    resultado coincide bit a bit.
+    """
+    n = len(points)
+    x, y = points[:, 0], points[:, 1]
+    xl, yl = x.tolist(), y.tolist()
+    tolerance2 = tolerance ** 2
+    collinear = mode == "colineal"
+    absorbed_action = "sustituir" if collinear else "descartar"
+    kept = [0]
+    anchor = 0
+    # En "colineal" los dos primeros puntos se guardan siempre y el último guardado es siempre el anterior
+    j = 2 if collinear else 1
+    window = TRAMO_DIEZMADO
+    run = None  # puntos absorbidos seguidos cuando se va punto a punto; None con tramos vectorizados
+    while j < n:
+        if run is not None:
+            if collinear:
+                action = _decimate(mode, tolerance, (xl[anchor], yl[anchor]), (xl[j - 1], yl[j - 1]), xl[j], yl[j])
+            else:
+                action = _decimate(mode, tolerance, None, (xl[anchor], yl[anchor]), xl[j], yl[j])
+            if action == absorbed_action:
+                run += 1
+                if run == TRAMO_DIEZMADO:
+                    run = None
+                    window = TRAMO_DIEZMADO
+            else:
+                anchor = j - 1 if collinear else j
+                kept.append(anchor)
+                run = 0
+            j += 1
+            continue
+        end = min(n, j + window)
+        ax, ay = x[anchor], y[anchor]
+        if collinear:
+            bx, by = x[j - 1:end - 1] - ax, y[j - 1:end - 1] - ay
+            ux, uy = x[j:end] - ax, y[j:end] - ay
+            norm2 = ux * ux + uy * uy
+            along = bx * ux + by * uy
+            cross = bx * uy - by * ux
+            absorbed = (norm2 > 0) & (0 <= along) & (along <= norm2) & (cross * cross < tolerance2 * norm2)
+        else:
+            dx, dy = x[j:end] - ax, y[j:end] - ay
+            absorbed = dx ** 2 + dy ** 2 < tolerance2
+        breaks = np.flatnonzero(~absorbed)
+        if not len(breaks):
+            j = end
+            window *= 2
+            continue
+        new = j + int(breaks[0])
+        anchor = new - 1 if collinear else new
+        kept.append(anchor)
+        if new - j < TRAMO_DIEZMADO // 4:
+            run = 0
+        j = new + 1
+        window = TRAMO_DIEZMADO
+    if collinear and n - 1 > kept[-1]:
+        kept.append(n - 1)
+    return np.array(kept)
+
+
+class TrailPyramid:
+    """Rastro de capacidad fija con niveles de detalle para dibujarlo a cualquier escala.
+
+    El nivel k guarda uno de cada ratio**k puntos y cada bloque de `block`
+    puntos del nivel 0 tiene su caja (xmin, ymin, xmax, ymax). Una consulta
+    descarta los bloques cuya caja no toca la zona visible y elige el nivel
+    más fino que no pase de `budget` puntos, así que el coste de dibujar
+    depende de lo que se ve y no de la longitud total. El nivel 0 guarda los
+    puntos en float64 y dos veces, en i y en i + capacidad, de modo que los
+    vigentes siempre forman un bloque contiguo y view() no copia; los niveles
+    gruesos solo sirven para dibujar y van en float32 (unos 35 bytes por
+    punto entre todos).
+
+    Todos los niveles son anillos de bloques enteros: se guardan al menos
+    `capacity` puntos y, cuando no caben más, se descarta el bloque más
+    antiguo de cada nivel a la vez, de modo que la memoria no crece con la
+    longitud del recorrido. total cuenta los puntos añadidos desde el
+    último clear() y first es el índice del más antiguo que se conserva.
+    Modos de diezmado:
+      - None: guarda todos los puntos.
+      - "distancia": descarta puntos a menos de `tolerancia` del último guardado.
+      - "colineal": si el último punto queda a menos de `tolerancia` de la
+        recta entre el penúltimo y el nuevo, se sustituye en vez de añadir
+        (Douglas-Peucker incremental para tramos rectos).
+    """
+
+    def __init__(self, capacity=CAPACIDAD_RASTRO, decimation=None, tolerance=0.5, levels=NIVELES,
+                 ratio=PASO_NIVEL, block=PUNTOS_BLOQUE):
+        if capacity < 2:
+            raise ValueError("La capacidad del rastro debe ser al menos 2")
+        if decimation not in (None, "distancia", "colineal"):
+            raise ValueError(f"Modo de diezmado desconocido: {decimation}")
+        if block % ratio ** (levels - 1):
+            raise ValueError("El bloque debe ser múltiplo del paso del nivel más grueso")
+        self.decimation = decimation
+        self.tolerance = tolerance
+        self.ratio = ratio
+        self.block = block
+        # Un bloque de más para que al descartar el más antiguo sigan quedando `capacity` puntos
+        blocks = -(-capacity // block) + 1
+        self.capacity = blocks * block
+        self._strides = [ratio ** k for k in range(levels)]
+        self._points = np.empty((2 * self.capacity, 2), dtype=np.float64)
+        self._levels = [self._points[:self.capacity]] + [np.empty((self.capacity // stride, 2), dtype=np.float32)
+                                                         for stride in self._strides[1:]]
+        self._boxes = np.empty((blocks, 4), dtype=np.float64)
+        self.generation = -1
+        self.clear()
+
+    def clear(self):
+        self.first = 0
+        self.total = 0
+        self.version = 0
+        self.generation += 1
+
+    def __len__(self):
+        return self.total - self.first
+
+    @staticmethod
+    def _ring(array, lo, hi):
+        """Filas lo..hi (índices absolutos, hi - lo <= len(array)) de un anillo, sin copiar si no da la vuelta."""
+        size = len(array)
+        begin = lo % size
+        end = begin + hi - lo
+        if end <= size:
+            return array[begin:end]
+        return np.concatenate((array[begin:], array[:end - size]))
+
+    @staticmethod
+    def _put(array, lo, rows):
+        """Escribe rows en un anillo a partir del índice absoluto lo (len(rows) <= len(array))."""
+        begin = lo % len(array)
+        head = min(len(rows), len(array) - begin)
+        array[begin:begin + head] = rows[:head]
+        array[:len(rows) - head] = rows[head:]
+
+    def _last(self, back=1):
+        return tuple(float(v) for v in self._levels[0][(self.total - back) % self.capacity])
+
+    def _write(self, index, x, y):
+        for level, stride in zip(self._levels, self._strides):
+            if index % stride:
+                break
+            level[index // stride % len(level)] = (x, y)
+        self._points[index % self.capacity + self.capacity] = (x, y)
+        box = self._boxes[index // self.block % len(self._boxes)]
+        if index % self.block == 0:
+            box[:] = (x, y, x, y)
+        else:
+            # Al sustituir un punto la caja solo crece: sigue cubriendo el bloque
+            box[:] = (min(box[0], x), min(box[1], y), max(box[2], x), max(box[3], y))
+        self.version += 1
+
+    def append(self, x, y):
+        if self.decimation is not None:
+            action = _decimate(self.decimation, self.tolerance, self._last(2) if len(self) >= 2 else None,
+                               self._last() if len(self) else None, x, y)
+            if action == "descartar":
+                return
+            if action == "sustituir":
+                self._write(self.total - 1, x, y)
+                return
+        if self.total - self.first == self.capacity:
+            self.first += self.block
+        self._write(self.total, x, y)
+        self.total += 1
+
+    def extend(self, xs, ys):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if not len(xs):
+            return
+        if self.decimation is not None:
+            # Igual que append() punto a punto, pero decidiendo todos los puntos a la vez
+            stored = min(len(self), 2 if self.decimation == "colineal" else 1)
+            points = np.concatenate((self.tail(stored), np.column_stack((xs, ys))))
+            kept = _decimate_batch(self.decimation, self.tolerance, points)
+            if stored == 2 and kept[1] != 1:
+                # El último guardado se sustituyó por el primer punto nuevo que queda
+                self._write(self.total - 1, *points[kept[1]])
+                kept = kept[2:]
+            kept = kept[kept >= stored]
+            if not len(kept):
+                return
+            xs, ys = points[kept, 0], points[kept, 1]
+        n = len(xs)
+        end = self.total + n
+        if end - self.first > self.capacity:
+            # Primer bloque que sigue cabiendo; lo anterior ni se escribe
+            self.first = -(-(end - self.capacity) // self.block) * self.block
+        skip = max(0, self.first - self.total)
+        first = self.total + skip
+        xs, ys = xs[skip:], ys[skip:]
+        n -= skip
+        points = np.column_stack((xs, ys))
+        for level, stride in zip(self._levels, self._strides):
+            offset = -first % stride
+            self._put(level, (first + offset) // stride, points[offset::stride])
+        self._put(self._points[self.capacity:], first, points)
+
+        # Cajas de los bloques tocados; la del primero se une a la que ya había
+        cuts = np.unique(np.concatenate(([0], np.arange(-first % self.block, n, self.block))))
+        boxes = np.column_stack((np.minimum.reduceat(xs, cuts), np.minimum.reduceat(ys, cuts),
+                                 np.maximum.reduceat(xs, cuts), np.maximum.reduceat(ys, cuts)))
+        first_block = first // self.block
+        if first % self.block:
+            old = self._boxes[first_block % len(self._boxes)]
+            boxes[0] = (min(old[0], boxes[0, 0]), min(old[1], boxes[0, 1]),
+                        max(old[2], boxes[0, 2]), max(old[3], boxes[0, 3]))
+        self._boxes[(first_block + np.arange(len(boxes))) % len(self._boxes)] = boxes
+        self.total = end
+        self.version += 1
+
+    @property
+    def nbytes(self):
+        return self._points.nbytes + sum(level.nbytes for level in self._levels[1:]) + self._boxes.nbytes
+
+    def view(self):
+        """Vista (N, 2) float64 de solo lectura sobre los puntos conservados, del más antiguo al último."""
+        start = self.first % self.capacity
+        v = self._points[start:start + len(self)]
+        v.flags.writeable = False
+        return v
+
+    @property
+    def xs(self):
+        return self.view()[:, 0]
+
+    @property
+    def ys(self):
+        return self.view()[:, 1]
+
+    def tail(self, n):
+        """Últimos n puntos (o menos) a resolución completa, como vista (n, 2) float64 sin copia."""
+        return self.view()[max(0, len(self) - n):]
+
+    def _live_boxes(self):
+        return self._ring(self._boxes, self.first // self.block, -(-self.total // self.block))
+
+    def bounds(self):
+        """Caja (xmin, ymin, xmax, ymax) del rastro que se conserva, o None si está vacío."""
+        if not len(self):
+            return None
+        boxes = self._live_boxes()
+        return (boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max())
+
+    def visible_segments(self, xmin, ymin, xmax, ymax, budget=PUNTOS_VISIBLES):
+        """Segmentos (M, 4) x1, y1, x2, y2 del rastro que pueden verse en la caja dada.
+
+        Se usan los bloques cuya caja la toca, más el punto vecino a cada
+        lado para que las líneas que entran y salen de la zona no se corten.
+        """
+        if len(self) < 2:
+            return np.empty((0, 4))
+        boxes = self._live_boxes()
+        hit = (boxes[:, 0] <= xmax) & (boxes[:, 2] >= xmin) & (boxes[:, 1] <= ymax) & (boxes[:, 3] >= ymin)
+        visible = np.count_nonzero(hit) * self.block
+        if not visible:
+            return np.empty((0, 4))
+        k = 0
+        while k < len(self._strides) - 1 and visible // self._strides[k] > budget:
+            k += 1
+        stride = self._strides[k]
+        level = self._levels[k]
+        oldest = self.first // stride
+        count = -(-self.total // stride)
+
+        first_block = self.first // self.block
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], hit.view(np.int8), [0])))) + first_block
+        parts = []
+        for begin, end in zip(edges[::2], edges[1::2]):
+            lo = max(oldest, begin * self.block // stride - 1)
+            hi = min(count, -(-end * self.block // stride) + 1)
+            points = self._ring(level, lo, hi)
+            if hi == count and (count - 1) * stride != self.total - 1:
+                # El último punto no siempre cae en este nivel
+                points = np.concatenate((points, self.tail(1)))
+            parts.append(np.concatenate((points[:-1], points[1:]), axis=1))
+        return np.concatenate(parts).astype(np.float64)
@@ -0,0 +1,109 @@
+import itertools
+
+import numpy as np
+
+from odometria import integrate_ticks
+
+# Formato binario: cabecera de 16 bytes seguida de registros fijos de 16 bytes
+# (timestamp en segundos, ticks izquierda, ticks derecha). Los ticks son los
+# incrementos desde el registro anterior, igual que en move_by_encoders, y los
+# timestamps deben ser no decrecientes.
+MAGIC = b"ODOLOG\x00\x01"
+CABECERA = 16
+REGISTRO = np.dtype([("t", "<f8"), ("left", "<i4"), ("right", "<i4")])
+PASO_INDICE = 4096  # registros entre entradas del índice de timestamps
+BLOQUE = 1 << 18  # registros que se integran de una vez
+
+
+def write_log(path, t, left_ticks, right_ticks):
+    records = np.empty(len(t), dtype=REGISTRO)
+    records["t"] = t
+    records["left"] = left_ticks
+    records["right"] = right_ticks
+    with open(path, "wb") as f:
+        f.write(MAGIC.ljust(CABECERA, b"\x00"))
+        records.tofile(f)
+
+
+def csv_to_log(csv_path, log_path, chunk_rows=1_000_000):
+    """Convierte un CSV timestamp,left,right (con o sin cabecera) al formato binario."""
+    with open(csv_path) as src, open(log_path, "wb") as dst:
+        dst.write(MAGIC.ljust(CABECERA, b"\x00"))
+        first = src.readline()
+        try:
+            [float(v) for v in first.split(",")]
+            lines = itertools.chain([first], src)
+        except ValueError:
+            lines = src
+        while True:
+            rows = list(itertools.islice(lines, chunk_rows))
+            if not rows:
+                break
+            data = np.loadtxt(rows, delimiter=",", ndmin=2)
+            records = np.empty(len(data), dtype=REGISTRO)
+            records["t"] = data[:, 0]
+            records["left"] = data[:, 1]
+            records["right"] = data[:, 2]
+            records.tofile(dst)
+
+
+class EncoderLog:
+    """Log de encoders mapeado en memoria, sin cargarlo entero en RAM."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} no es un log de encoders")
+        self.records = np.memmap(path, dtype=REGISTRO, mode="r", offset=CABECERA)
+        self.t = self.records["t"]
+        self.left = self.records["left"]
+        self.right = self.records["right"]
+        # Índice disperso: un timestamp de cada PASO_INDICE registros
+        self._index_t = np.array(self.t[::PASO_INDICE])
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def start_time(self):
+        return float(self.t[0]) if len(self) else 0.0
+
+    @property
+    def end_time(self):
+        return float(self.t[-1]) if len(self) else 0.0
+
+    def index_at(self, time):
+        """Número de registros con timestamp <= time, en O(log n)."""
+        block = int(np.searchsorted(self._index_t, time, side="right")) - 1
+        if block < 0:
+            return 0
+        start = block * PASO_INDICE
+        chunk = np.asarray(self.t[start:start + PASO_INDICE])
+        return start + int(np.searchsorted(chunk, time, side="right"))
+
+    def iter_chunks(self, start=0, stop=None, chunk=BLOQUE):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for begin in range(start, stop, chunk):
+            end = min(begin + chunk, stop)
+            yield self.t[begin:end], self.left[begin:end], self.right[begin:end]
+
+
+def stream_poses(log, start=0, stop=None, pose=(0.0, 0.0, 0.0, 0.0), chunk=BLOQUE, method="euler"):
+    """Integra los registros [start, stop) por bloques.
+
+    Devuelve un generador de (x, y, theta, distancia) por bloque; la memoria
+    usada depende solo del tamaño de bloque, no de la longitud del log.
+    """
+    x0, y0, theta0, d0 = pose
+    for _, left, right in log.iter_chunks(start, stop, chunk):
+        x, y, theta, distancia = integrate_ticks(left, right, x0, y0, theta0, d0, method=method)
+        x0, y0, theta0, d0 = x[-1], y[-1], theta[-1], distancia[-1]
+        yield x, y, theta, distancia
+
+
+def pose_at_index(log, index, pose=(0.0, 0.0, 0.0, 0.0), method="euler"):
+    """Pose tras integrar los primeros `index` registros."""
+    for x, y, theta, distancia in stream_poses(log, 0, index, pose, method=method):
+        pose = (x[-1], y[-1], theta[-1], distancia[-1])
+    return tuple(float(v) for v in pose)
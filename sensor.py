@@ -0,0 +1,131 @@
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+from odometria import DIAMETRO_RUEDA_L, DIAMETRO_RUEDA_R, RESOLUCION_ENCODER
+
+FRECUENCIA_MUESTREO = 1000  # Hz
+BITS_CONTADOR = 16
+MUESTRAS_POR_BLOQUE = 1 << 20
+
+
+@dataclass(frozen=True)
+class EncoderModel:
+    """Defectos de un encoder incremental de rueda.
+
+    prob_perdido y prob_duplicado son probabilidades por pulso; el contador
+    del hardware tiene bits_contador bits y da la vuelta al desbordar; jitter
+    es la desviación típica (s) del timestamp de cada muestra.
+    """
+    diametro: float = DIAMETRO_RUEDA_L  # cm
+    resolucion: int = RESOLUCION_ENCODER
+    prob_perdido: float = 0.0
+    prob_duplicado: float = 0.0
+    bits_contador: int = BITS_CONTADOR
+    jitter: float = 0.0
+
+    @property
+    def pulso_cm(self):
+        return math.pi * self.diametro / self.resolucion
+
+
+class WheelEncoder:
+    """Encoder de una rueda que convierte posición continua (cm) en lecturas del contador.
+
+    Guarda el estado entre bloques (última cuenta ideal y cuenta acumulada
+    con errores), de modo que un flujo largo se puede generar por bloques.
+    """
+
+    def __init__(self, model=EncoderModel(), rng=None):
+        self.model = model
+        self.rng = np.random.default_rng() if rng is None else rng
+        self._ideal = 0  # cuenta sin errores de la última muestra
+        self._count = 0  # cuenta con pulsos perdidos y duplicados, sin desbordar
+
+    def sample(self, position_cm):
+        """Lecturas del contador (uint64 ya envuelto a bits_contador bits) en cada posición."""
+        model = self.model
+        ideal = np.floor(np.asarray(position_cm, dtype=np.float64) / model.pulso_cm).astype(np.int64)
+        delta = np.diff(ideal, prepend=self._ideal)
+        self._ideal = int(ideal[-1]) if len(ideal) else self._ideal
+
+        if model.prob_perdido or model.prob_duplicado:
+            pulses = np.abs(delta)
+            sign = np.sign(delta)
+            if model.prob_perdido:
+                delta = delta - sign * self.rng.binomial(pulses, model.prob_perdido)
+            if model.prob_duplicado:
+                delta = delta + sign * self.rng.binomial(pulses, model.prob_duplicado)
+
+        count = self._count + np.cumsum(delta)
+        if len(count):
+            self._count = int(count[-1])
+        return (count & ((1 << model.bits_contador) - 1)).astype(np.uint64)
+
+
+def counter_deltas(counters, bits=BITS_CONTADOR, previous=0):
+    """Ticks entre lecturas consecutivas de un contador que da la vuelta, como lo haría el firmware.
+
+    Supone que entre dos muestras no se mueven más de 2**(bits - 1) pulsos.
+    """
+    counters = np.asarray(counters, dtype=np.int64)
+    modulo = 1 << bits
+    delta = np.diff(counters, prepend=np.int64(previous)) % modulo
+    return np.where(delta >= modulo // 2, delta - modulo, delta)
+
+
+class EncoderPair:
+    """Pareja de encoders muestreada a frecuencia fija a partir del movimiento de las ruedas."""
+
+    def __init__(self, left=EncoderModel(), right=EncoderModel(diametro=DIAMETRO_RUEDA_R),
+                 sample_rate=FRECUENCIA_MUESTREO, seed=None):
+        rng = np.random.default_rng(seed)
+        self.sample_rate = sample_rate
+        self.left = WheelEncoder(left, rng)
+        self.right = WheelEncoder(right, rng)
+        self.rng = rng
+        self.samples = 0
+        self._last_left = 0
+        self._last_right = 0
+
+    def sample_block(self, left_cm, right_cm):
+        """Muestrea posiciones de rueda (cm) en instantes consecutivos.
+
+        Devuelve (timestamps con jitter, contador izquierdo, contador derecho).
+        """
+        n = len(left_cm)
+        t = (self.samples + np.arange(n)) / self.sample_rate
+        jitter = max(self.left.model.jitter, self.right.model.jitter)
+        if jitter:
+            # El jitter no puede desordenar las muestras
+            t = np.maximum.accumulate(t + jitter * self.rng.standard_normal(n))
+        self.samples += n
+        return t, self.left.sample(left_cm), self.right.sample(right_cm)
+
+    def ticks_block(self, left_cm, right_cm):
+        """Como sample_block, pero con los ticks por muestra listos para integrate_ticks."""
+        t, left, right = self.sample_block(left_cm, right_cm)
+        left_ticks = counter_deltas(left, self.left.model.bits_contador, self._last_left)
+        right_ticks = counter_deltas(right, self.right.model.bits_contador, self._last_right)
+        if len(t):
+            self._last_left, self._last_right = int(left[-1]), int(right[-1])
+        return t, left_ticks, right_ticks
+
+    def stream(self, left_speed, right_speed, duration, block=MUESTRAS_POR_BLOQUE):
+        """Genera bloques (t, ticks izquierda, ticks derecha) para velocidades de rueda en cm/s.
+
+        Las velocidades pueden ser constantes o funciones vectorizadas del
+        tiempo; la posición de cada rueda se integra entre bloques.
+        """
+        total = int(round(duration * self.sample_rate))
+        dt = 1.0 / self.sample_rate
+        left_pos = right_pos = 0.0
+        for start in range(0, total, block):
+            t = (start + 1 + np.arange(min(block, total - start))) * dt
+            vl = left_speed(t) if callable(left_speed) else np.full(len(t), float(left_speed))
+            vr = right_speed(t) if callable(right_speed) else np.full(len(t), float(right_speed))
+            left_cm = left_pos + np.cumsum(vl * dt)
+            right_cm = right_pos + np.cumsum(vr * dt)
+            left_pos, right_pos = left_cm[-1], right_cm[-1]
+            yield self.ticks_block(left_cm, right_cm)
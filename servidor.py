@@ -0,0 +1,335 @@
+import argparse
+import asyncio
+import struct
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+from mapa import ObstacleMap
+from odometria import METODOS_INTEGRACION, step_tracks
+
+# Tramas binarias en little endian: cabecera de 12 bytes (longitud de los
+# datos uint32, tipo uint8, opciones uint8, robot uint16, petición uint32)
+# seguida de los datos. Cada respuesta lleva el robot y la petición de la
+# trama que contesta, así que un cliente puede mandar muchas seguidas sin
+# esperar (pipelining) y emparejarlas después; se contestan en orden.
+CABECERA = struct.Struct("<IBBHI")
+MOVER = 1  # datos: pares de ticks (izquierda, derecha) int32
+COLOCAR = 2  # datos: x, y, ángulo en grados (3 float64)
+CONSULTAR = 3  # sin datos
+SUSCRIBIR = 4  # datos: frecuencia en Hz (float64); 0 cancela
+POSE = 0x81  # datos: POSE_FINAL y, con CON_POSES, la pose estimada tras cada paso
+ESTADO = 0x82  # datos: un ROBOT_ESTADO por robot
+ERROR = 0xFF  # datos: mensaje en UTF-8
+
+CON_ERROR = 1  # opción de MOVER: simula el error de la rueda derecha en toda la ráfaga
+CON_POSES = 2  # opción de MOVER: devuelve las poses de cada paso, no solo la final
+
+TICKS = np.dtype([("left", "<i4"), ("right", "<i4")])
+POSE_FINAL = struct.Struct("<I7d")  # pasos aceptados, x, y, ángulo, x real, y real, ángulo real, recorrido
+POSES = np.dtype([("x", "<f8"), ("y", "<f8"), ("angle", "<f8")])
+ROBOT_ESTADO = np.dtype([("robot", "<u2"), ("x", "<f8"), ("y", "<f8"), ("angle", "<f8"),
+                         ("true_x", "<f8"), ("true_y", "<f8"), ("true_angle", "<f8"), ("recorrido", "<f8")])
+
+PUERTO = 8765
+MUNDO = (500, 500)  # cm, el mismo rectángulo que el simulador
+POSE_INICIAL = (40.0, 450.0, 0.0)  # la de SimulationWidget.reset (ángulo en grados)
+MAX_DATOS = 1 << 24  # bytes de datos por trama
+LIMITE_ESCRITURA = 1 << 20  # bytes pendientes de enviar antes de esperar al cliente
+PASOS_POR_TURNO = 4096  # pasos de una ráfaga MOVER entre dos cesiones del bucle de eventos
+
+
+def frame(kind, robot=0, request=0, payload=b"", options=0):
+    return CABECERA.pack(len(payload), kind, options, robot, request) + payload
+
+
+class Robot:
+    """Pose real y estimada de un robot que avanza con step_tracks, como SimulationWidget.move_by_encoders.
+
+    La pose real sigue los ticks y es la que choca con los bordes y el
+    mapa; la estimada integra los mismos ticks con el error simulado. Los
+    ángulos se guardan en grados igual que en el widget, de modo que las
+    poses coinciden bit a bit con las suyas.
+    """
+
+    def __init__(self, pose=POSE_INICIAL):
+        self.place(*pose)
+
+    def place(self, x, y, angle):
+        self.x = self.true_x = x
+        self.y = self.true_y = y
+        self.angle = self.true_angle = angle % 360
+        self.recorrido = 0.0
+
+    def move(self, left_ticks, right_ticks, simulate_error=False, method="euler", world_size=MUNDO,
+             obstacle_map=None):
+        step = step_tracks((self.true_x, self.true_y, self.true_angle), (self.x, self.y, self.angle), left_ticks,
+                           right_ticks, simulate_error, method, world_size, obstacle_map)
+        if step is None:
+            return False
+        (self.true_x, self.true_y, self.true_angle, _), (self.x, self.y, self.angle, _), recorrido = step
+        self.recorrido += recorrido
+        return True
+
+    def pack(self, accepted=0):
+        return POSE_FINAL.pack(accepted, self.x, self.y, self.angle, self.true_x, self.true_y, self.true_angle,
+                               self.recorrido)
+
+
+class PoseServer:
+    """Servidor asyncio que mueve robots con ráfagas de ticks recibidas por TCP o por un socket Unix.
+
+    Los robots se identifican por el número de la cabecera y se crean en
+    POSE_INICIAL la primera vez que se nombran; son compartidos, así que
+    varias conexiones pueden mover y observar los mismos. Cada conexión se
+    atiende en su propia tarea y solo espera al cliente cuando tiene más de
+    LIMITE_ESCRITURA bytes sin enviar. Las ráfagas largas ceden el bucle
+    cada PASOS_POR_TURNO pasos para no parar al resto de conexiones; un
+    cerrojo por robot hace que las peticiones sobre ese robot esperen a que
+    acabe la ráfaga en curso.
+    """
+
+    def __init__(self, world_size=MUNDO, obstacle_map=None, method="euler"):
+        self.world_size = world_size
+        self.obstacle_map = obstacle_map
+        self.method = method
+        self.robots = {}
+        self._locks = {}
+        self.updates = 0  # pasos de física procesados
+        self.connections = 0
+        self._server = None
+
+    def robot(self, robot_id):
+        robot = self.robots.get(robot_id)
+        if robot is None:
+            robot = self.robots[robot_id] = Robot()
+            self._locks[robot_id] = asyncio.Lock()
+        return robot
+
+    def state(self):
+        """Array ROBOT_ESTADO con todos los robots, ordenado por número."""
+        states = np.empty(len(self.robots), dtype=ROBOT_ESTADO)
+        for i, (robot_id, robot) in enumerate(sorted(self.robots.items())):
+            states[i] = (robot_id, robot.x, robot.y, robot.angle, robot.true_x, robot.true_y, robot.true_angle,
+                         robot.recorrido)
+        return states
+
+    async def _move(self, robot, payload, options):
+        if len(payload) % TICKS.itemsize:
+            raise ValueError(f"MOVER necesita pares de ticks int32 y llegaron {len(payload)} bytes")
+        ticks = np.frombuffer(payload, dtype=TICKS)
+        simulate_error = bool(options & CON_ERROR)
+        move = robot.move
+        accepted = 0
+        poses = np.empty(len(ticks), dtype=POSES) if options & CON_POSES else None
+        for begin in range(0, len(ticks), PASOS_POR_TURNO):
+            if begin:
+                await asyncio.sleep(0)
+            chunk = ticks[begin:begin + PASOS_POR_TURNO].tolist()
+            if poses is not None:
+                for i, (left, right) in enumerate(chunk, begin):
+                    accepted += move(left, right, simulate_error, self.method, self.world_size, self.obstacle_map)
+                    poses[i] = (robot.x, robot.y, robot.angle)
+            else:
+                for left, right in chunk:
+                    accepted += move(left, right, simulate_error, self.method, self.world_size, self.obstacle_map)
+        extra = b"" if poses is None else poses.tobytes()
+        self.updates += len(ticks)
+        return robot.pack(accepted) + extra
+
+    async def handle(self, kind, options, robot_id, payload):
+        """Datos de la respuesta POSE a una trama de petición."""
+        if kind not in (MOVER, COLOCAR, CONSULTAR):
+            raise ValueError(f"tipo de trama desconocido: {kind}")
+        if kind == COLOCAR and len(payload) != 24:
+            raise ValueError("COLOCAR necesita x, y y ángulo en float64")
+        robot = self.robot(robot_id)
+        async with self._locks[robot_id]:
+            if kind == MOVER:
+                return await self._move(robot, payload, options)
+            if kind == COLOCAR:
+                robot.place(*struct.unpack("<3d", payload))
+            return robot.pack()
+
+    async def _publish(self, writer, hz):
+        while True:
+            # Un espejo lento se salta estados en lugar de acumularlos
+            if writer.transport.get_write_buffer_size() < LIMITE_ESCRITURA:
+                writer.write(frame(ESTADO, payload=self.state().tobytes()))
+            await asyncio.sleep(1 / hz)
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        publisher = None
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(CABECERA.size)
+                except asyncio.IncompleteReadError:
+                    break
+                length, kind, options, robot_id, request = CABECERA.unpack(header)
+                if length > MAX_DATOS:
+                    writer.write(frame(ERROR, robot_id, request, f"trama de {length} bytes demasiado larga".encode()))
+                    break
+                payload = await reader.readexactly(length) if length else b""
+                if kind == SUSCRIBIR:
+                    if publisher is not None:
+                        publisher.cancel()
+                        publisher = None
+                    hz = struct.unpack("<d", payload)[0] if len(payload) == 8 else 0.0
+                    if hz > 0:
+                        publisher = asyncio.ensure_future(self._publish(writer, hz))
+                    continue
+                try:
+                    response = frame(POSE, robot_id, request, await self.handle(kind, options, robot_id, payload))
+                except ValueError as error:
+                    response = frame(ERROR, robot_id, request, str(error).encode())
+                writer.write(response)
+                if writer.transport.get_write_buffer_size() > LIMITE_ESCRITURA:
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if publisher is not None:
+                publisher.cancel()
+            self.connections -= 1
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=PUERTO, path=None):
+        """Empieza a escuchar en host:port o, con path, en un socket Unix."""
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._serve, path)
+        else:
+            self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server
+
+    async def serve_forever(self, host="127.0.0.1", port=PUERTO, path=None):
+        server = await self.start(host, port, path)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+
+@dataclass
+class PoseReply:
+    aceptados: int
+    pose: tuple  # x, y, ángulo en grados de la pose estimada
+    pose_real: tuple
+    recorrido: float
+    poses: np.ndarray = None  # POSES tras cada paso, si se pidieron
+
+
+def _parse_pose(payload):
+    accepted, x, y, angle, true_x, true_y, true_angle, recorrido = POSE_FINAL.unpack_from(payload)
+    poses = np.frombuffer(payload, dtype=POSES, offset=POSE_FINAL.size) if len(payload) > POSE_FINAL.size else None
+    return PoseReply(accepted, (x, y, angle), (true_x, true_y, true_angle), recorrido, poses)
+
+
+class PoseClient:
+    """Cliente asyncio de PoseServer.
+
+    Cada petición se escribe en cuanto se llama y devuelve una corrutina
+    que espera su respuesta, así que asyncio.gather() sobre muchas llamadas
+    las manda todas seguidas sin esperar a cada respuesta. Los estados de
+    una suscripción llegan a la cola `states`.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.states = asyncio.Queue()
+        self._pending = {}
+        self._request = 0
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=PUERTO, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _receive(self):
+        try:
+            while True:
+                length, kind, _, _, request = CABECERA.unpack(await self.reader.readexactly(CABECERA.size))
+                payload = await self.reader.readexactly(length) if length else b""
+                if kind == ESTADO:
+                    self.states.put_nowait(np.frombuffer(payload, dtype=ROBOT_ESTADO))
+                    continue
+                future = self._pending.pop(request, None)
+                if future is None or future.done():
+                    continue
+                if kind == ERROR:
+                    future.set_exception(ValueError(payload.decode()))
+                else:
+                    future.set_result(_parse_pose(payload))
+        except (asyncio.IncompleteReadError, ConnectionError) as error:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"conexión cerrada: {error}"))
+            self._pending.clear()
+
+    def _send(self, kind, robot, payload=b"", options=0):
+        self._request = (self._request + 1) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._request] = future
+        self.writer.write(frame(kind, robot, self._request, payload, options))
+        return self._wait(future)
+
+    async def _wait(self, future):
+        if self.writer.transport.get_write_buffer_size() > LIMITE_ESCRITURA:
+            await self.writer.drain()
+        return await future
+
+    def move(self, robot, left_ticks, right_ticks, simulate_error=False, poses=False):
+        """Manda una ráfaga de ticks (escalares o arrays) y devuelve la PoseReply al final de ella."""
+        left, right = np.broadcast_arrays(np.atleast_1d(left_ticks), np.atleast_1d(right_ticks))
+        ticks = np.empty(len(left), dtype=TICKS)
+        ticks["left"] = left
+        ticks["right"] = right
+        options = (CON_ERROR if simulate_error else 0) | (CON_POSES if poses else 0)
+        return self._send(MOVER, robot, ticks.tobytes(), options)
+
+    def place(self, robot, x, y, angle=0.0):
+        return self._send(COLOCAR, robot, struct.pack("<3d", x, y, angle))
+
+    def pose(self, robot):
+        return self._send(CONSULTAR, robot)
+
+    def subscribe(self, hz):
+        self.writer.write(frame(SUSCRIBIR, payload=struct.pack("<d", hz)))
+
+    async def close(self):
+        self._receiver.cancel()
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de poses: mueve robots con ticks recibidos por un socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--unix", metavar="RUTA", help="escucha en un socket Unix en lugar de TCP")
+    parser.add_argument("--mapa", help="plano de obstáculos JSON")
+    parser.add_argument("--metodo", choices=METODOS_INTEGRACION, default="euler")
+    parser.add_argument("--sin-limites", action="store_true", help="deja que los robots salgan del área de 5 x 5 m")
+    args = parser.parse_args(argv)
+
+    server = PoseServer(None if args.sin_limites else MUNDO, ObstacleMap.load(args.mapa) if args.mapa else None,
+                        args.metodo)
+    print(f"Escuchando en {args.unix or f'{args.host}:{args.puerto}'}")
+    try:
+        asyncio.run(server.serve_forever(args.host, args.puerto, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Formato binario: MAGIC, longitud (uint32) y JSON con los parámetros de la
+# simulación, seguidos de eventos de 13 bytes (paso de física uint64, tipo
+# uint8, valor uint32). En las teclas el valor es el código de Qt; en los
+# eventos con datos es la longitud de los bytes que siguen. El evento FIN
+# guarda en JSON el estado final con el que se comparan las repeticiones.
+MAGIC = b"ODOSES\x00\x01"
+EVENTO = struct.Struct("<QBI")
+LONGITUD = struct.Struct("<I")
+
+TECLA_PULSADA = 1
+TECLA_SOLTADA = 2
+MISION = 3  # texto de la misión ejecutada
+MAPA = 4  # segmentos del plano de obstáculos en JSON
+REPRODUCCION = 5  # se reprodujo un log: el resto de la sesión depende del reloj real
+FIN = 255
+CON_DATOS = (MISION, MAPA, FIN)
+
+
+def _digest(*arrays):
+    h = hashlib.sha256()
+    for array in arrays:
+        h.update(np.ascontiguousarray(array).tobytes())
+    return h.hexdigest()
+
+
+def session_state(window):
+    """Estado final de una MainWindow que debe coincidir bit a bit al repetir la sesión."""
+    widget = window.simulation_widget
+    fleet = widget.fleet
+    return {
+        "pasos": window.loop.ticks,
+        "pose": [widget.robot_position.x(), widget.robot_position.y(), widget.robot_angle],
+        "pose_real": [widget.true_position.x(), widget.true_position.y(), widget.true_angle],
+        "recorrido": window.recorridoRobot,
+        "ate": widget.drift.ate_rmse,
+        "puntos": [len(widget.trail), len(widget.true_trail)],
+        "rastro": _digest(widget.trail.tail(len(widget.trail))),
+        "rastro_real": _digest(widget.true_trail.tail(len(widget.true_trail))),
+        "flota": None if fleet is None else _digest(fleet.x, fleet.y, fleet.theta),
+        "cobertura": _digest(widget.coverage.counts),
+    }
+
+
+class SessionRecorder:
+    """Diario binario de una sesión interactiva: parámetros y eventos de entrada por paso de física."""
+
+    def __init__(self, path, params):
+        self.path = path
+        self.events = 0
+        self._file = open(path, "wb")
+        header = json.dumps(params).encode()
+        self._file.write(MAGIC + LONGITUD.pack(len(header)) + header)
+
+    def _write(self, tick, kind, value, payload=b""):
+        self._file.write(EVENTO.pack(tick, kind, value) + payload)
+        self.events += 1
+
+    def _write_data(self, tick, kind, data):
+        payload = data.encode()
+        self._write(tick, kind, len(payload), payload)
+
+    def key_pressed(self, tick, key):
+        self._write(tick, TECLA_PULSADA, int(key))
+
+    def key_released(self, tick, key):
+        self._write(tick, TECLA_SOLTADA, int(key))
+
+    def mission(self, tick, source):
+        self._write_data(tick, MISION, source)
+
+    def obstacle_map(self, tick, segments):
+        self._write_data(tick, MAPA, json.dumps(np.asarray(segments).tolist()))
+
+    def log_replay(self, tick):
+        self._write(tick, REPRODUCCION, 0)
+
+    def close(self, state):
+        if self._file is None:
+            return
+        self._write_data(state["pasos"], FIN, json.dumps(state))
+        self._file.close()
+        self._file = None
+
+
+def read_session(path):
+    """Devuelve (parámetros, [(paso, tipo, valor)], estado final o None si la sesión no se cerró)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} no es un diario de sesión")
+    offset = len(MAGIC)
+    (length,) = LONGITUD.unpack_from(data, offset)
+    offset += LONGITUD.size
+    params = json.loads(data[offset:offset + length])
+    offset += length
+    events = []
+    final = None
+    while offset + EVENTO.size <= len(data):
+        tick, kind, value = EVENTO.unpack_from(data, offset)
+        offset += EVENTO.size
+        if kind in CON_DATOS:
+            payload = data[offset:offset + value]
+            offset += value
+            value = payload.decode()
+        if kind == FIN:
+            final = json.loads(value)
+            break
+        events.append((tick, kind, value))
+    return params, events, final
+
+
+def _application():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6 import QtWidgets
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def replay_session(path, ticks=None):
+    """Repite un diario sin ventana ni timers, tan rápido como se pueda, y devuelve session_state().
+
+    Los eventos se aplican con el mismo código que las teclas reales, antes
+    del paso de física en que ocurrieron. Los tramos sin movimiento ni flota
+    se saltan de golpe. Sin ticks se avanza hasta el final grabado.
+    """
+    app = _application()
+    from giodometria_final import MainWindow
+    from mapa import ObstacleMap
+
+    params, events, final = read_session(path)
+    if ticks is None:
+        ticks = final["pasos"] if final is not None else (events[-1][0] if events else 0)
+    world_size = params["mundo"]
+    window = MainWindow(world_size=None if world_size is None else tuple(world_size), seed=params["semilla"],
+                        physics_hz=params["frecuencia_fisica"])
+    loop = window.loop
+    loop.stop()
+    window.log_timer.stop()
+
+    def advance(until):
+        while loop.ticks < until:
+            if not (loop.left_speed or loop.right_speed) and loop.fleet_fn is None:
+                loop.ticks = until
+            else:
+                loop.step()
+
+    try:
+        for tick, kind, value in events:
+            if tick > ticks:
+                break
+            advance(tick)
+            if kind == TECLA_PULSADA:
+                window._procesar_tecla(value)
+            elif kind == TECLA_SOLTADA:
+                window._soltar_tecla(value)
+            elif kind == MISION:
+                window.ejecutar_texto_mision(value)
+            elif kind == MAPA:
+                window.simulation_widget.set_obstacle_map(ObstacleMap(json.loads(value)))
+            elif kind == REPRODUCCION:
+                raise ValueError(f"{path}: la sesión reprodujo un log en el paso {tick} y no se puede repetir")
+            else:
+                raise ValueError(f"{path}: evento desconocido {kind} en el paso {tick}")
+        advance(ticks)
+        return session_state(window)
+    finally:
+        window.deleteLater()
+        app.processEvents()
+
+
+def verify_session(path):
+    """Claves del estado final que no coinciden con las grabadas (vacío si la repetición es idéntica)."""
+    expected = read_session(path)[2]
+    if expected is None:
+        raise ValueError(f"{path}: la sesión no se cerró y no tiene estado final")
+    state = replay_session(path)
+    return [key for key in expected if state.get(key) != expected[key]]
+
+
+def _verify_one(path):
+    start = time.perf_counter()
+    try:
+        return path, verify_session(path), None, time.perf_counter() - start
+    except (OSError, ValueError) as error:
+        return path, None, str(error), time.perf_counter() - start
+
+
+def verify_sessions(paths, workers=None):
+    """Verifica muchos diarios en paralelo; lista de (ruta, claves distintas, error, segundos)."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(paths) <= 1:
+        return [_verify_one(path) for path in paths]
+    # Cada proceso crea su propia QApplication; el padre no llega a crearla
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_verify_one, paths))
+
+
+def update_session(path):
+    """Regraba el estado final de un diario con el resultado de repetirlo (tras un cambio intencionado)."""
+    params, events, _ = read_session(path)
+    state = replay_session(path)
+    recorder = SessionRecorder(path, params)
+    for tick, kind, value in events:
+        if kind in CON_DATOS:
+            recorder._write_data(tick, kind, value)
+        else:
+            recorder._write(tick, kind, value)
+    recorder.close(state)
+    return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Repite diarios de sesión y comprueba que el estado final es idéntico")
+    parser.add_argument("sesiones", nargs="+", help="diarios .odoses grabados con --grabar")
+    parser.add_argument("--procesos", type=int, default=None, help="procesos en paralelo (por defecto, todos)")
+    parser.add_argument("--actualizar", action="store_true",
+                        help="sustituye el estado final grabado por el de la repetición")
+    args = parser.parse_args(argv)
+
+    if args.actualizar:
+        for path in args.sesiones:
+            state = update_session(path)
+            print(f"ACTUALIZADA {path}: {state['pasos']} pasos")
+        return 0
+
+    failures = 0
+    for path, differences, error, seconds in verify_sessions(args.sesiones, args.procesos):
+        if error is not None:
+            print(f"ERROR {path}: {error}")
+        elif differences:
+            print(f"DIFERENTE {path}: {', '.join(differences)}")
+        else:
+            print(f"OK {path} ({seconds:.2f} s)")
+            continue
+        failures += 1
+    print(f"{len(args.sesiones) - failures}/{len(args.sesiones)} sesiones idénticas")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import glob
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet es opcional; sin pyarrow se escribe .npz
+    pyarrow = None
+
+FORMATOS = ("npz", "parquet")
+
+COLUMNAS = (("step", np.int64), ("x", np.float64), ("y", np.float64), ("heading", np.float64),
+            ("recorrido", np.float64), ("error", np.bool_))
+FILAS_POR_SEGMENTO = 1 << 16
+INTERVALO_FLUSH = 1.0  # s
+_FIN = object()
+
+
+class TelemetrySink:
+    """Guarda muestras de pose en disco desde un hilo escritor en segundo plano.
+
+    record() y record_batch() solo encolan, así que nunca bloquean la
+    interfaz ni el paso de física. El hilo escritor agrupa las muestras en
+    segmentos por columnas (telemetria_000000.parquet si pyarrow está
+    instalado, si no .npz; format fuerza uno de los dos) y vacía lo
+    pendiente al menos cada flush_interval segundos.
+    """
+
+    def __init__(self, directory, segment_rows=FILAS_POR_SEGMENTO, flush_interval=INTERVALO_FLUSH, format=None):
+        if format is None:
+            format = "npz" if pyarrow is None else "parquet"
+        if format == "parquet" and pyarrow is None:
+            raise ImportError("El formato parquet necesita pyarrow")
+        if format not in FORMATOS:
+            raise ValueError(f"Formato de telemetría desconocido: {format}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.flush_interval = flush_interval
+        self.format = format
+        self.segments = len(_segment_paths(directory))
+        self.rows_written = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="telemetria", daemon=True)
+        self._thread.start()
+
+    def record(self, step, x, y, heading, recorrido, error=False):
+        self._queue.put((step, x, y, heading, recorrido, error))
+
+    def record_batch(self, steps, x, y, heading, recorrido, error=False):
+        n = len(steps)
+        columns = [np.broadcast_to(np.asarray(v, dtype=dtype), (n,))
+                   for v, (_, dtype) in zip((steps, x, y, heading, recorrido, error), COLUMNAS)]
+        self._queue.put(columns)
+
+    def close(self):
+        self._queue.put(_FIN)
+        self._thread.join()
+
+    def _run(self):
+        rows = []  # muestras sueltas
+        blocks = []  # bloques ya en columnas, en orden de llegada junto a rows
+        pending = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _FIN:
+                self._flush(rows, blocks)
+                return
+            if isinstance(item, tuple):
+                rows.append(item)
+                pending += 1
+            elif item is not None:
+                if rows:
+                    blocks.append(self._rows_to_columns(rows))
+                    rows = []
+                blocks.append(item)
+                pending += len(item[0])
+            if pending >= self.segment_rows or time.monotonic() >= deadline:
+                self._flush(rows, blocks)
+                rows, blocks, pending = [], [], 0
+                deadline = time.monotonic() + self.flush_interval
+
+    @staticmethod
+    def _rows_to_columns(rows):
+        return [np.array(column, dtype=dtype) for column, (_, dtype) in zip(zip(*rows), COLUMNAS)]
+
+    def _flush(self, rows, blocks):
+        if rows:
+            blocks = blocks + [self._rows_to_columns(rows)]
+        if not blocks:
+            return
+        columns = {name: np.concatenate([block[i] for block in blocks])
+                   for i, (name, _) in enumerate(COLUMNAS)}
+        path = os.path.join(self.directory, f"telemetria_{self.segments:06d}.{self.format}")
+        tmp = path + ".tmp"
+        if self.format == "parquet":
+            pyarrow.parquet.write_table(pyarrow.table(columns), tmp)
+        else:
+            with open(tmp, "wb") as f:
+                np.savez(f, **columns)
+        os.replace(tmp, path)
+        self.segments += 1
+        self.rows_written += len(columns["step"])
+
+
+def _segment_paths(directory):
+    """Segmentos ya terminados; los .tmp a medio escribir no cuentan."""
+    return sorted(path for extension in FORMATOS
+                  for path in glob.glob(os.path.join(directory, f"telemetria_*.{extension}")))
+
+
+def load_telemetry(directory):
+    """Junta todos los segmentos de un directorio en un dict de columnas."""
+    parts = []
+    for path in _segment_paths(directory):
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                parts.append({name: data[name] for name, _ in COLUMNAS})
+        elif path.endswith(".parquet"):
+            table = pyarrow.parquet.read_table(path)
+            parts.append({name: table[name].to_numpy() for name, _ in COLUMNAS})
+    return {name: np.concatenate([p[name] for p in parts]) if parts else np.empty(0, dtype)
+            for name, dtype in COLUMNAS}
@@ -0,0 +1,83 @@
+import numpy as np
+
+ESCALA_MINIMA = 1e-4  # píxeles por cm
+ESCALA_MAXIMA = 100.0
+PASO_REJILLA = 50.0  # cm
+SEPARACION_MINIMA_REJILLA = 10  # píxeles entre líneas de la rejilla
+
+
+class Viewport:
+    """Transformación entre coordenadas del mundo (cm) y píxeles del lienzo.
+
+    center es el punto del mundo que cae en el centro del lienzo y scale los
+    píxeles por cm. version cambia con cada zoom, desplazamiento o cambio de
+    tamaño, para que las capas cacheadas sepan cuándo rehacerse. Con el
+    lienzo de 500 x 500, center (250, 250) y scale 1 se obtiene el mapeo
+    original de un cm por píxel.
+    """
+
+    def __init__(self, width, height, center=None, scale=1.0):
+        self.width = width
+        self.height = height
+        self.center = (width / 2, height / 2) if center is None else tuple(center)
+        self.scale = scale
+        self.version = 0
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        self.version += 1
+
+    def to_screen(self, points):
+        """Puntos (..., 2) del mundo a píxeles."""
+        points = np.asarray(points, dtype=np.float64)
+        offset = np.array((self.width / 2 - self.center[0] * self.scale, self.height / 2 - self.center[1] * self.scale))
+        return points * self.scale + offset
+
+    def to_world(self, sx, sy):
+        return (self.center[0] + (sx - self.width / 2) / self.scale,
+                self.center[1] + (sy - self.height / 2) / self.scale)
+
+    def offset(self):
+        """(dx, dy) tales que pixel = punto * scale + (dx, dy)."""
+        return self.width / 2 - self.center[0] * self.scale, self.height / 2 - self.center[1] * self.scale
+
+    def visible_rect(self):
+        """Caja (xmin, ymin, xmax, ymax) del mundo que cubre el lienzo."""
+        x0, y0 = self.to_world(0, 0)
+        x1, y1 = self.to_world(self.width, self.height)
+        return x0, y0, x1, y1
+
+    def zoom(self, factor, sx=None, sy=None):
+        """Multiplica la escala dejando fijo el punto del mundo bajo el píxel (sx, sy)."""
+        if sx is None:
+            sx, sy = self.width / 2, self.height / 2
+        wx, wy = self.to_world(sx, sy)
+        self.scale = min(max(self.scale * factor, ESCALA_MINIMA), ESCALA_MAXIMA)
+        self.center = (wx - (sx - self.width / 2) / self.scale, wy - (sy - self.height / 2) / self.scale)
+        self.version += 1
+
+    def pan(self, dx, dy):
+        """Desplaza la vista dx, dy píxeles (el contenido se mueve con el ratón)."""
+        self.center = (self.center[0] - dx / self.scale, self.center[1] - dy / self.scale)
+        self.version += 1
+
+    def fit(self, xmin, ymin, xmax, ymax, margin=0.05):
+        """Centra la caja dada y ajusta la escala para que quepa entera con un margen relativo."""
+        width = max(xmax - xmin, 1e-9) * (1 + 2 * margin)
+        height = max(ymax - ymin, 1e-9) * (1 + 2 * margin)
+        self.center = ((xmin + xmax) / 2, (ymin + ymax) / 2)
+        self.scale = min(max(min(self.width / width, self.height / height), ESCALA_MINIMA), ESCALA_MAXIMA)
+        self.version += 1
+
+    def grid_lines(self, step=PASO_REJILLA):
+        """Segmentos (M, 4) de la rejilla en píxeles, con paso step * 10**k según el zoom."""
+        while step * self.scale < SEPARACION_MINIMA_REJILLA:
+            step *= 10
+        x0, y0, x1, y1 = self.visible_rect()
+        xs = np.arange(np.ceil(x0 / step), np.floor(x1 / step) + 1) * step
+        ys = np.arange(np.ceil(y0 / step), np.floor(y1 / step) + 1) * step
+        vertical = np.column_stack((xs, np.full_like(xs, y0), xs, np.full_like(xs, y1)))
+        horizontal = np.column_stack((np.full_like(ys, x0), ys, np.full_like(ys, x1), ys))
+        lines = np.concatenate((vertical, horizontal)).reshape(-1, 2)
+        return self.to_screen(lines).reshape(-1, 4)